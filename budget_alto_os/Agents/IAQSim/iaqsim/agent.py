@@ -1,9 +1,9 @@
-import random
-import time
 import psycopg2
 from volttron.platform.agent import utils
+from volttron.platform.scheduling import periodic
 from volttron.platform.vip.agent import Agent, Core, PubSub
 import logging
+import numpy as np
 from datetime import datetime, timezone
 
 utils.setup_logging()
@@ -26,26 +26,62 @@ SENSOR_POINT_MAP = {
 class IAQSimAgent(Agent):
     def __init__(self, config_path, **kwargs):
         super().__init__(**kwargs)
+        config = utils.load_config(config_path) or {}
         self.sensor_count = 10
+        self.publish_interval = config.get("publish_interval", 30)
+        self.publish_event = None
+        # Publish all readings of a cycle as one message on "iaq/batch". Set to
+        # False to fall back to one "iaq/<sensor_id>" message per sensor.
+        self.batch_publish = config.get("batch_publish", True)
+        self._rng = np.random.default_rng()
 
     @Core.receiver("onstart")
     def onstart(self, sender, **kwargs):
-        while True:
-            for sensor_id in range(1, self.sensor_count + 1):
-                data = {
-                    "sensor_id": sensor_id,
-                    "co2": random.randint(400, 1000),
-                    "temperature": round(random.uniform(20, 30), 2),
-                    "humidity": round(random.uniform(30, 70), 2),
-                    "timestamp": datetime.now(timezone.utc).isoformat()
-                }
-                logger.info(f"🌡️ Publishing data for sensor {sensor_id}: {data}")
+        self._publish_tick()
+        # Publish for all sensors every publish_interval seconds (config, 30 by default)
+        self.publish_event = self.core.schedule(
+            periodic(self.publish_interval), self._publish_tick
+        )
+
+    @Core.receiver("onstop")
+    def onstop(self, sender, **kwargs):
+        # Stop publishing when the agent stops
+        if self.publish_event:
+            self.publish_event.cancel()
+
+    def _publish_tick(self):
+        readings = []
+        # All readings of a tick are published together, so they share one timestamp
+        timestamp = datetime.now(timezone.utc).isoformat()
+        # Draw the values of every sensor at once instead of per sensor
+        co2 = self._rng.integers(400, 1001, size=self.sensor_count).tolist()
+        temperature = self._rng.uniform(20, 30, size=self.sensor_count).round(2).tolist()
+        humidity = self._rng.uniform(30, 70, size=self.sensor_count).round(2).tolist()
+        for sensor_id, co2_value, temp_value, humid_value in zip(
+            range(1, self.sensor_count + 1), co2, temperature, humidity
+        ):
+            data = {
+                "sensor_id": sensor_id,
+                "co2": co2_value,
+                "temperature": temp_value,
+                "humidity": humid_value,
+                "timestamp": timestamp
+            }
+            readings.append(data)
+        logger.debug("🌡️ Publishing data for %s sensors: %s", len(readings), readings)
+        if self.batch_publish:
+            self.vip.pubsub.publish(
+                peer="pubsub",
+                topic="iaq/batch",
+                message={"readings": readings}
+            )
+        else:
+            for data in readings:
                 self.vip.pubsub.publish(
                     peer="pubsub",
-                    topic=f"iaq/{sensor_id}",
+                    topic=f"iaq/{data['sensor_id']}",
                     message=data
                 )
-            time.sleep(30)
 
 def main():
     utils.vip_main(IAQSimAgent, version="0.1")
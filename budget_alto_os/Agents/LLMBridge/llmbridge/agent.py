@@ -1,8 +1,12 @@
 # budget_alto_os/Agents/LLMBridge/llmbridge/agent.py
 
 import threading
+from collections import deque
+from itertools import islice
 import uvicorn
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from volttron.platform.vip.agent import Agent, Core
 from volttron.platform.agent import utils
@@ -22,36 +26,72 @@ class EnergyAnalysisRequest(BaseModel):
     # Add more fields as needed
 
 # --- FastAPI App ---
-app = FastAPI(title="LLM Bridge Agent API")
+app = FastAPI(title="LLM Bridge Agent API", default_response_class=ORJSONResponse)
+
+async def _current_iaq(agent, zones):
+    """
+    Latest IAQ reading per zone, from the realtime cache first and then from
+    TimescaleDB in a single query for the zones missing from the cache. The
+    blocking psycopg2 helpers run in the threadpool to keep the event loop free.
+    """
+    results = {zone: agent.realtime_cache["iaq"].get(zone) for zone in zones}
+    missing = [zone for zone, data in results.items() if not data]
+    if missing:
+        # Fallback: TimescaleDB, through the same TTL cache whatever the number of zones
+        results.update(await run_in_threadpool(helper.get_latest_iaq_for_zones, missing))
+    return {zone: data or {"error": "No data available"} for zone, data in results.items()}
+
+async def _current_power(agent, meters):
+    """
+    Latest power reading per meter, from the realtime cache first and then from
+    TimescaleDB in a single query for the meters missing from the cache. The
+    blocking psycopg2 helpers run in the threadpool to keep the event loop free.
+    Meter ids are numbers, any other id is answered with a 400.
+    """
+    invalid = [meter for meter in meters if not (meter.isascii() and meter.isdigit())]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid meter id(s): {', '.join(invalid)}")
+    results = {meter: agent.realtime_cache["power"].get(meter) for meter in meters}
+    missing = [meter for meter, data in results.items() if not data]
+    if missing:
+        # Fallback: TimescaleDB, through the same TTL cache whatever the number of meters
+        results.update(await run_in_threadpool(helper.get_latest_power_for_meters, missing))
+    return {meter: data or {"error": "No data available"} for meter, data in results.items()}
+
+def _split_ids(ids: str):
+    # Repeated ids are only looked up once, in the order first given
+    return list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+
+@app.get("/api/current/iaq")
+async def get_current_iaq_zones(zones: str):
+    """
+    Latest IAQ readings of several zones, e.g. /api/current/iaq?zones=a,b,c
+    """
+    return await _current_iaq(app.state.agent, _split_ids(zones))
 
 @app.get("/api/current/iaq/{zone}")
 async def get_current_iaq(zone: str):
-    agent = app.state.agent
-    data = agent.realtime_cache["iaq"].get(zone)
-    if data:
-        return {"zone": zone, **data}
-    # Fallback: query TimescaleDB
-    db_data = helper.get_latest_iaq_for_zone(zone)
-    if db_data:
-        return {"zone": zone, **db_data}
-    return {"zone": zone, "error": "No data available"}
+    data = await _current_iaq(app.state.agent, [zone])
+    return {"zone": zone, **data[zone]}
+
+@app.get("/api/current/power")
+async def get_current_power_meters(meters: str):
+    """
+    Latest power readings of several meters, e.g. /api/current/power?meters=1,2,3
+    """
+    return await _current_power(app.state.agent, _split_ids(meters))
 
 @app.get("/api/current/power/{meter}")
 async def get_current_power(meter: str):
-    agent = app.state.agent
-    data = agent.realtime_cache["power"].get(meter)
-    if data:
-        return {"meter": meter, **data}
-    # Fallback: query TimescaleDB
-    db_data = helper.get_latest_power_for_meter(meter)
-    if db_data:
-        return {"meter": meter, **db_data}
-    return {"meter": meter, "error": "No data available"}
+    data = await _current_power(app.state.agent, [meter])
+    return {"meter": meter, **data[meter]}
 
 @app.get("/api/alerts/recent")
 async def get_recent_alerts():
     agent = app.state.agent
-    return {"alerts": agent.realtime_cache["alerts"][-10:]}  # Last 10 alerts
+    alerts = agent.realtime_cache["alerts"]
+    # Last 10 alerts, read from the newest end so that only those 10 are walked
+    return {"alerts": list(islice(reversed(alerts), 10))[::-1]}
     
 @app.get("/api/historical/energy_consumption")
 async def get_historical_energy_consumption(hours_ago: int = 24):
@@ -61,7 +101,7 @@ async def get_historical_energy_consumption(hours_ago: int = 24):
     if hours_ago <= 0:
         raise HTTPException(status_code=400, detail="hours_ago must be a positive integer.")
     
-    db_data = helper.get_total_consumption_for_period(hours_ago)
+    db_data = await run_in_threadpool(helper.get_total_consumption_for_period, hours_ago)
     return {"hours_ago": hours_ago, **db_data}
 
 
@@ -82,7 +122,7 @@ class LLMBridgeAgent(Agent):
         self.realtime_cache = {
             "iaq": {},
             "power": {},
-            "alerts": []
+            "alerts": deque(maxlen=1000)  # Ring buffer, oldest alerts are dropped
         }
         app.state.agent = self
 
@@ -100,18 +140,31 @@ class LLMBridgeAgent(Agent):
         self.vip.pubsub.subscribe(peer="pubsub", prefix="powermeter", callback=self.on_power_update)
         # Start FastAPI in a background thread
         def run_api():
-            uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
+            # uvloop and httptools instead of the default asyncio loop and h11 parser.
+            # A single worker: the API shares realtime_cache with this agent process.
+            uvicorn.run(
+                app, host="0.0.0.0", port=8000, log_level="info",
+                loop="uvloop", http="httptools"
+            )
         threading.Thread(target=run_api, daemon=True).start()
 
     def on_iaq_update(self, peer, sender, bus, topic, headers, message):
-    # topic: "iaq/{zone_id}"
-        zone_id = topic.split("/")[1] if "/" in topic else "unknown"
+    # topic: "iaq/{zone_id}" or "iaq/batch" with {"readings": [...]}
+        if topic == "iaq/batch":
+            for reading in message.get("readings", []):
+                self._cache_iaq_reading(str(reading.get("sensor_id", "unknown")), reading)
+            return
+        zone_id = topic.partition("/")[2] or "unknown"
+        self._cache_iaq_reading(zone_id, message)
+
+    def _cache_iaq_reading(self, zone_id, message):
         self.realtime_cache["iaq"][zone_id] = {
             "co2": message.get("co2"),
             "temperature": message.get("temperature"),
             "humidity": message.get("humidity"),
             "timestamp": message.get("timestamp")
         }
+        # The DB cache is keyed by BRICK zone, not by sensor number, it expires on its own
         # Example anomaly detection
         if message.get("co2", 0) > 1200:
             self.realtime_cache["alerts"].append({
@@ -120,13 +173,22 @@ class LLMBridgeAgent(Agent):
                 "value": message["co2"],
                 "timestamp": message.get("timestamp")
             })
+
     def on_power_update(self, peer, sender, bus, topic, headers, message):
-    # topic: "powermeter/{meter_id}"
-        meter_id = topic.split("/")[1] if "/" in topic else "unknown"
+    # topic: "powermeter/{meter_id}" or "powermeter/batch" with {"readings": [...]}
+        if topic == "powermeter/batch":
+            for reading in message.get("readings", []):
+                self._cache_power_reading(str(reading.get("meter_id", "unknown")), reading)
+            return
+        meter_id = topic.partition("/")[2] or "unknown"
+        self._cache_power_reading(meter_id, message)
+
+    def _cache_power_reading(self, meter_id, message):
         self.realtime_cache["power"][meter_id] = {
             "power": message.get("power"),
             "timestamp": message.get("timestamp")
             }
+        helper.invalidate_power(meter_id)
     
     
 
@@ -1,7 +1,14 @@
 # budget_alto_os/Agents/LLMBridge/llmbridge/helper.py
 
-import psycopg2
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from cachetools import TTLCache, cached
+from cachetools.keys import hashkey
+from psycopg2.extensions import connection as PGConnection
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
 
 DB_CONFIG = {
     "dbname": "postgres",
@@ -11,75 +18,211 @@ DB_CONFIG = {
     "port": 5432
 }
 
+# BRICK point_ids of all power meters, used for building-wide consumption
+POWER_POINT_IDS = tuple(f"pm_{i:03d}_power" for i in range(1, 6))
+
+
+class PreparedConnection(PGConnection):
+    """
+    Connection keeping track of the server-side prepared statements of its session.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+    def prepare(self, name, statement, params=None):
+        """
+        Run the PREPARE statement once per session.
+        """
+        if name not in self.prepared:
+            with self.cursor() as cur:
+                cur.execute(statement, params)
+            self.commit()
+            self.prepared.add(name)
+
+
+# Shared pool so that each API request borrows an open connection instead of
+# doing a full connect/auth handshake. Created lazily on first use so that the
+# agent can start before the database is reachable.
+_pool = None
+_pool_lock = threading.Lock()
+POOL_MAXCONN = 10
+# The API handlers run these helpers on the threadpool, which has more threads
+# than the pool has connections. ThreadedConnectionPool raises PoolError when it
+# is exhausted, so callers wait here for a free connection instead.
+_pool_slots = threading.BoundedSemaphore(POOL_MAXCONN)
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # Concurrent first requests would each create (and leak) a pool
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(
+                    minconn=2,
+                    maxconn=POOL_MAXCONN,
+                    connection_factory=PreparedConnection,
+                    cursor_factory=RealDictCursor,
+                    **DB_CONFIG
+                )
+    return _pool
+
+
+@contextmanager
+def get_connection():
+    """
+    Borrow a connection from the pool and give it back once done. Blocks while
+    all the connections are in use.
+    """
+    with _pool_slots:
+        pool = _get_pool()
+        conn = pool.getconn()
+        try:
+            yield conn
+        finally:
+            pool.putconn(conn)
+
+
+# Short-lived caches in front of the DB queries. Sensors only publish every
+# 15-30s, so current readings are cached for 10s and the historical SUM for 60s.
+_cache_lock = threading.Lock()
+_iaq_cache = TTLCache(maxsize=256, ttl=10)
+_power_cache = TTLCache(maxsize=256, ttl=10)
+_consumption_cache = TTLCache(maxsize=256, ttl=60)
+
+
+def invalidate_power(meter_id):
+    """
+    Drop the cached DB reading of a meter, e.g. when a fresher value arrived on the bus.
+    """
+    with _cache_lock:
+        _power_cache.pop(hashkey(meter_id), None)
+
+
+def _cached_many(cache, ids, fetch):
+    """
+    Value of each id from cache, the missing ones are fetched with a single
+    fetch(missing) call and cached, ids without data included (as {}).
+    """
+    results = {}
+    with _cache_lock:
+        for key in ids:
+            value = cache.get(hashkey(key))
+            if value is not None:
+                results[key] = value
+    missing = [key for key in ids if key not in results]
+    if missing:
+        fetched = fetch(missing)
+        with _cache_lock:
+            for key in missing:
+                results[key] = cache[hashkey(key)] = fetched.get(key, {})
+    return results
+
+
 def get_latest_iaq_for_zone(zone_id):
     """
     Returns the latest CO2, temperature, humidity for a given zone.
     """
+    return get_latest_iaq_for_zones([zone_id])[zone_id]
+
+def get_latest_iaq_for_zones(zone_ids):
+    """
+    Returns the latest CO2, temperature, humidity for several zones, keyed by
+    zone_id ({} for zones without data). Zones missing from the cache are read
+    in one query.
+    """
+    return _cached_many(_iaq_cache, zone_ids, _query_latest_iaq)
+
+def _query_latest_iaq(zone_ids):
+    # latest_point_value holds one row per point_id, refreshed every 15s
+    # and point_zone_mapping the zone of each point, so this is a single join
     query = """
-    SELECT s1.point_id, s1.value, s1.timestamp
-    FROM sensor_data s1
-    JOIN brick_points bp ON s1.point_id = bp.point_id
-    JOIN brick_entities be ON bp.device_id = be.entity_id
-    JOIN brick_relationships br ON be.entity_id = br.subject_id
-    WHERE br.predicate = 'brick:hasLocation'
-      AND br.object_id = %s
-      AND bp.point_type IN ('co2', 'temperature', 'humidity')
-      AND s1.timestamp = (
-          SELECT MAX(s2.timestamp)
-          FROM sensor_data s2
-          WHERE s2.point_id = s1.point_id
-      )
-    """
-    result = {}
-    with psycopg2.connect(**DB_CONFIG) as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query, (zone_id,))
+    SELECT pzm.zone_id, pzm.point_type, lv.value, lv.timestamp
+    FROM latest_point_value lv
+    JOIN point_zone_mapping pzm USING (point_id)
+    WHERE pzm.zone_id = ANY(%s)
+      AND pzm.point_type IN ('co2', 'temperature', 'humidity')
+    """
+    results = {}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (list(zone_ids),))
             for row in cur.fetchall():
-                if row["point_id"].endswith("_co2"):
-                    result["co2"] = row["value"]
-                elif row["point_id"].endswith("_temperature"):
-                    result["temperature"] = row["value"]
-                elif row["point_id"].endswith("_humid"):
-                    result["humidity"] = row["value"]
-                result["timestamp"] = row["timestamp"]
-    return result
+                result = results.setdefault(row["zone_id"], {})
+                # point_type is already "co2", "temperature" or "humidity"
+                result[row["point_type"]] = row["value"]
+                # The zone is as recent as its most recent reading
+                if result.get("timestamp") is None or (
+                    row["timestamp"] is not None and row["timestamp"] > result["timestamp"]
+                ):
+                    result["timestamp"] = row["timestamp"]
+    return results
 
 def get_latest_power_for_meter(meter_id):
     """
     Returns the latest power value for a given meter.
     """
+    return get_latest_power_for_meters([meter_id])[meter_id]
+
+def get_latest_power_for_meters(meter_ids):
+    """
+    Returns the latest power value for several meters, keyed by the given
+    meter_id ({} for meters without data). Meters missing from the cache are
+    read in one query. Meter ids must be numbers, ValueError otherwise.
+    """
+    return _cached_many(_power_cache, meter_ids, _query_latest_power)
+
+def _query_latest_power(meter_ids):
     query = """
-    SELECT s.value, s.timestamp
-    FROM sensor_data s
-    WHERE s.point_id = %s
-    ORDER BY s.timestamp DESC
-    LIMIT 1
-    """
-    point_id = f"pm_{int(meter_id):03d}_power"
-    with psycopg2.connect(**DB_CONFIG) as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query, (point_id,))
-            row = cur.fetchone()
-            if row:
-                return {"power": row["value"], "timestamp": row["timestamp"]}
-    return {}
+    SELECT point_id, value, timestamp
+    FROM latest_point_value
+    WHERE point_id = ANY(%s)
+    """
+    # "1" and "001" are the same meter, each id asked for gets the reading
+    point_to_meters = {}
+    for meter_id in meter_ids:
+        point_to_meters.setdefault(f"pm_{int(meter_id):03d}_power", []).append(meter_id)
+    results = {}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (list(point_to_meters),))
+            for row in cur.fetchall():
+                for meter_id in point_to_meters[row["point_id"]]:
+                    results[meter_id] = {
+                        "power": row["value"],
+                        "timestamp": row["timestamp"]
+                    }
+    return results
 
+@cached(_consumption_cache, lock=_cache_lock)
 def get_total_consumption_for_period(hours_ago: int) -> dict:
     """
     Calculates total energy consumption (kWh) from all power meters over a given period.
     This query assumes that the `value` column for power is in kW and readings are
     taken hourly. Therefore, summing the values provides an approximation of kWh.
     """
-    point_ids = [f"pm_{i:03d}_power" for i in range(1, 6)]
-    query = """
-    SELECT SUM(value) as total_kwh
-    FROM sensor_data
-    WHERE point_id = ANY(%s)
-    AND timestamp >= (NOW() - %s * INTERVAL '1 hour')
+    # Point ids are static, so they are bound once at PREPARE time and only
+    # the period is sent on each call. The hourly_kwh rollup already holds the
+    # SUM per hour and point, so whole hours are summed here: the bucket holding
+    # the start of the period is left out, so that, with the current (partial)
+    # hour, hours_ago buckets are counted. Both bounds are constants, so the
+    # planner can exclude every chunk outside the period.
+    prepare = """
+    PREPARE total_consumption(timestamptz, timestamptz) AS
+    SELECT SUM(total_kwh) as total_kwh
+    FROM hourly_kwh
+    WHERE point_id = ANY(%s::text[])
+    AND bucket >= $1
+    AND bucket < $2
     """
-    with psycopg2.connect(**DB_CONFIG) as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query, (point_ids, hours_ago))
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(hours=hours_ago)
+    with get_connection() as conn:
+        conn.prepare("total_consumption", prepare, (list(POWER_POINT_IDS),))
+        with conn.cursor() as cur:
+            cur.execute("EXECUTE total_consumption(%s, %s)", (start, end))
             result = cur.fetchone()
             if result and result.get('total_kwh') is not None:
                 return {"total_kwh": result['total_kwh']}
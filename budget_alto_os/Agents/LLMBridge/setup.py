@@ -11,8 +11,10 @@ setup(
     install_requires=[
         "volttron",
         "fastapi",
-        "uvicorn",
+        "uvicorn[standard]",  # Pulls in uvloop and httptools
+        "orjson",  # Faster JSON encoding of the API responses
         "psycopg2-binary",  # For TimescaleDB/Postgres access
+        "cachetools",  # TTL cache in front of the DB helpers
         # Add any other dependencies you need
     ],
     packages=find_packages(),
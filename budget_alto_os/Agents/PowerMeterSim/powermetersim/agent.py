@@ -1,9 +1,9 @@
-import random
-import time
 from datetime import datetime, timezone
 from volttron.platform.agent import utils
+from volttron.platform.scheduling import periodic
 from volttron.platform.vip.agent import Agent, Core, PubSub
 import logging
+import numpy as np
 
 utils.setup_logging()
 logger = logging.getLogger(__name__)
@@ -20,77 +20,114 @@ POWER_RANGES = {
 class PowerMeterSimAgent(Agent):
     def __init__(self, config_path, **kwargs):
         super().__init__(**kwargs)
+        config = utils.load_config(config_path) or {}
         self.meter_count = 5
+        self.publish_interval = config.get("publish_interval", 30)
+        self.publish_event = None
+        # Publish all readings of a cycle as one message on "powermeter/batch". Set
+        # to False to fall back to one "powermeter/<meter_id>" message per meter.
+        self.batch_publish = config.get("batch_publish", True)
 
-    def _generate_realistic_power(self, meter_id: int, timestamp: datetime) -> float:
+        # Per-meter ranges and type masks, so that a whole tick is computed with NumPy
+        self._rng = np.random.default_rng()
+        meter_keys = [f'pm_{i:03d}' for i in range(1, self.meter_count + 1)]
+        self._is_known = np.array([k in POWER_RANGES for k in meter_keys])
+        self._is_chiller = np.array([k == 'pm_004' for k in meter_keys])
+        self._is_elevator = np.array([k == 'pm_005' for k in meter_keys])
+        self._min_power = np.array(
+            [POWER_RANGES.get(k, {}).get('min', 0) for k in meter_keys], dtype=float
+        )
+        self._max_power = np.array(
+            [POWER_RANGES.get(k, {}).get('max', 0) for k in meter_keys], dtype=float
+        )
+
+    def _generate_realistic_power_batch(self, timestamp: datetime) -> np.ndarray:
         """
-        Generates realistic power consumption based on time of day, day of week,
-        and meter type, adapted from seed_historical_data.py.
+        Generates realistic power consumption for all meters at once, based on time of
+        day, day of week and meter type, adapted from seed_historical_data.py.
         """
         hour = timestamp.hour
-        weekday = timestamp.weekday()  # Monday is 0 and Sunday is 6
-        meter_key = f'pm_{meter_id:03d}'
-
-        meter_info = POWER_RANGES.get(meter_key)
-        if not meter_info:
-            return round(random.uniform(0.5, 5.0), 2) # Fallback for unknown meter
-
-        min_power = meter_info['min']
-        max_power = meter_info['max']
-        base_factor = 0.2  # Default base factor for after hours
-
-        if meter_key == 'pm_004':  # Chiller - weather dependent
-            if 10 <= hour <= 18:
-                base_factor = 0.7 + random.uniform(0, 0.3)  # High cooling load
-            elif 6 <= hour <= 22:
-                base_factor = 0.5 + random.uniform(0, 0.2)
-            else:
-                base_factor = 0.3 + random.uniform(0, 0.1)  # Night setback
-
-        elif meter_key == 'pm_005':  # Elevator - occupancy dependent
-            if weekday < 5:  # Weekday
-                if 8 <= hour <= 18:
-                    base_factor = 0.6 + random.uniform(0, 0.4)  # Busy periods
-                else:
-                    base_factor = 0.1 + random.uniform(0, 0.1)
-            else:  # Weekend
-                base_factor = 0.2
-
-        else:  # Floor meters (pm_001, pm_002, pm_003) - occupancy dependent
-            if weekday < 5:  # Weekday
-                if 9 <= hour <= 17:
-                    base_factor = 0.6 + random.uniform(0, 0.3)  # Business hours
-                elif hour in [8, 18]:
-                    base_factor = 0.5 + random.uniform(0, 0.2)  # Transition
-                else:
-                    base_factor = 0.2 + random.uniform(0, 0.1)  # After hours
-            else:  # Weekend
-                base_factor = 0.3
-
-        power = min_power + (max_power - min_power) * base_factor
-        power += random.uniform(-2, 2)  # Add some random variation
+        is_weekday = timestamp.weekday() < 5  # Monday is 0 and Sunday is 6
+
+        # Base factor of each meter type is offset + uniform(0, spread)
+        if 10 <= hour <= 18:  # Chiller - weather dependent
+            chiller = (0.7, 0.3)  # High cooling load
+        elif 6 <= hour <= 22:
+            chiller = (0.5, 0.2)
+        else:
+            chiller = (0.3, 0.1)  # Night setback
+
+        if not is_weekday:  # Elevator - occupancy dependent
+            elevator = (0.2, 0.0)
+        elif 8 <= hour <= 18:
+            elevator = (0.6, 0.4)  # Busy periods
+        else:
+            elevator = (0.1, 0.1)
+
+        if not is_weekday:  # Floor meters (pm_001, pm_002, pm_003) - occupancy dependent
+            floor = (0.3, 0.0)
+        elif 9 <= hour <= 17:
+            floor = (0.6, 0.3)  # Business hours
+        elif hour in [8, 18]:
+            floor = (0.5, 0.2)  # Transition
+        else:
+            floor = (0.2, 0.1)  # After hours
+
+        masks = [self._is_chiller, self._is_elevator]
+        offset = np.select(masks, [chiller[0], elevator[0]], default=floor[0])
+        spread = np.select(masks, [chiller[1], elevator[1]], default=floor[1])
+        base_factor = offset + spread * self._rng.random(self.meter_count)
+
+        power = self._min_power + (self._max_power - self._min_power) * base_factor
+        power += self._rng.uniform(-2, 2, self.meter_count)  # Add some random variation
+        # Fallback for unknown meters
+        power = np.where(
+            self._is_known, power, self._rng.uniform(0.5, 5.0, self.meter_count)
+        )
 
         # Ensure power is not unrealistically low, but can be 0 if meter is off
-        return round(max(0, power), 2)
+        return np.round(np.maximum(0, power), 2)
 
     @Core.receiver("onstart")
     def onstart(self, sender, **kwargs):
-        while True:
-            for meter_id in range(1, self.meter_count + 1):
-                now = datetime.now(timezone.utc)
-                power_value = self._generate_realistic_power(meter_id, now)
-                data = {
-                    "meter_id": meter_id,
-                    "power": power_value,
-                    "timestamp": now.isoformat()
-                }
-                logger.info(f"⚡ Publishing data for meter {meter_id}: {data}")
+        self._publish_tick()
+        # Publish for all meters every publish_interval seconds (config, 30 by default)
+        self.publish_event = self.core.schedule(
+            periodic(self.publish_interval), self._publish_tick
+        )
+
+    @Core.receiver("onstop")
+    def onstop(self, sender, **kwargs):
+        # Stop publishing when the agent stops
+        if self.publish_event:
+            self.publish_event.cancel()
+
+    def _publish_tick(self):
+        readings = []
+        now = datetime.now(timezone.utc)
+        timestamp = now.isoformat()
+        power_values = self._generate_realistic_power_batch(now).tolist()
+        for meter_id, power_value in enumerate(power_values, start=1):
+            data = {
+                "meter_id": meter_id,
+                "power": power_value,
+                "timestamp": timestamp
+            }
+            readings.append(data)
+        logger.debug("⚡ Publishing data for %s meters: %s", len(readings), readings)
+        if self.batch_publish:
+            self.vip.pubsub.publish(
+                peer="pubsub",
+                topic="powermeter/batch",
+                message={"readings": readings}
+            )
+        else:
+            for data in readings:
                 self.vip.pubsub.publish(
                     peer="pubsub",
-                    topic=f"powermeter/{meter_id}",
+                    topic=f"powermeter/{data['meter_id']}",
                     message=data
                 )
-            time.sleep(30) # Publish every 30 seconds for all meters
 
 def main():
     utils.vip_main(PowerMeterSimAgent, version="0.1")
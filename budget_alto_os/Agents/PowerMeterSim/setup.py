@@ -8,7 +8,7 @@ setup(
     version="0.1",
     author="Your Name",
     author_email="your@email.com",
-    install_requires=["volttron"],
+    install_requires=["volttron", "numpy"],
     packages=find_packages(),
     entry_points={
         "setuptools.installation": [
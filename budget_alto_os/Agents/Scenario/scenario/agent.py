@@ -1,8 +1,8 @@
-import random
-import time
 from datetime import datetime, timezone
 from volttron.platform.agent import utils
+from volttron.platform.scheduling import periodic
 from volttron.platform.vip.agent import Agent, Core
+import numpy as np
 
 utils.setup_logging()
 
@@ -10,43 +10,50 @@ class HighCO2ScenarioAgent(Agent):
     def __init__(self, config_path, **kwargs):
         super().__init__(**kwargs)
         self.target_sensor = 8
-        self.scenario_thread = None
+        self.scenario_event = None
+        self.sensor_count = 10
+        self.meter_count = 5
+        self._rng = np.random.default_rng()
 
     @Core.receiver("onstart")
     def onstart(self, sender, **kwargs):
-        # Start the scenario when the agent starts
-        self.scenario_thread = self.core.spawn(self.trigger_high_co2_scenario)
+        # Start the scenario when the agent starts, then repeat every 15 seconds
+        self.trigger_high_co2_scenario()
+        self.scenario_event = self.core.schedule(
+            periodic(15), self.trigger_high_co2_scenario
+        )
 
     @Core.receiver("onstop")
     def onstop(self, sender, **kwargs):
         # Stop the scenario when the agent stops
-        if self.scenario_thread:
-            self.scenario_thread.kill()
+        if self.scenario_event:
+            self.scenario_event.cancel()
 
     def trigger_high_co2_scenario(self):
-        while True:
-            # IAQ data
-            for sensor_id in range(1, 11):
-                if sensor_id == self.target_sensor:
-                    data = {
-                        "co2": random.randint(1250, 1400),
-                        "temperature": 26.5,
-                        "humidity": 45.0
-                    }
-                else:
-                    data = {
-                        "co2": random.randint(400, 700),
-                        "temperature": round(random.uniform(21, 24), 2),
-                        "humidity": round(random.uniform(40, 60), 2)
-                    }
-                self.vip.pubsub.publish("pubsub", f"iaq/{sensor_id}", message=data)
-
-            # Power data (normal)
-            for meter_id in range(1, 6):
-                data = {"power": round(random.uniform(0.5, 5.0), 2)}
-                self.vip.pubsub.publish("pubsub", f"powermeter/{meter_id}", message=data)
-
-            time.sleep(15)
+        # IAQ data, drawn for every sensor at once
+        co2 = self._rng.integers(400, 701, size=self.sensor_count)
+        temperature = self._rng.uniform(21, 24, size=self.sensor_count).round(2)
+        humidity = self._rng.uniform(40, 60, size=self.sensor_count).round(2)
+        target = self.target_sensor - 1
+        co2[target] = self._rng.integers(1250, 1401)
+        temperature[target] = 26.5
+        humidity[target] = 45.0
+        for sensor_id, co2_value, temp_value, humid_value in zip(
+            range(1, self.sensor_count + 1),
+            co2.tolist(), temperature.tolist(), humidity.tolist()
+        ):
+            data = {
+                "co2": co2_value,
+                "temperature": temp_value,
+                "humidity": humid_value
+            }
+            self.vip.pubsub.publish("pubsub", f"iaq/{sensor_id}", message=data)
+
+        # Power data (normal)
+        power = self._rng.uniform(0.5, 5.0, size=self.meter_count).round(2).tolist()
+        for meter_id, power_value in enumerate(power, start=1):
+            data = {"power": power_value}
+            self.vip.pubsub.publish("pubsub", f"powermeter/{meter_id}", message=data)
 
 def main():
     utils.vip_main(HighCO2ScenarioAgent, version="0.1")
@@ -17,7 +17,7 @@ setup(
     version=__version__,
     author="ZayarNaing",
     author_email="zayarnaing.ai@gmail.com",
-    install_requires=["volttron"],
+    install_requires=["volttron", "numpy", "sqlparse"],
     packages=packages,
     package_data={
         'timescaledb': [
@@ -0,0 +1,221 @@
+"""
+Unit tests of the wire formats written by the TimescaleDB agent: binary and CSV COPY streams,
+ISO timestamps read back from PostgreSQL and the $n filter conditions of the get/drop RPCs.
+They need no database, only the agent's own dependencies.
+"""
+
+import csv
+import datetime
+import io
+import os
+import struct
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("volttron")
+pytest.importorskip("altolib")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from psycopg2 import sql  # noqa: E402
+
+from timescaledb.agent import (  # noqa: E402
+    COPY_NULL,
+    PG_EPOCH,
+    PGCOPY_HEADER,
+    PGCOPY_INT8_LENGTH,
+    PGCOPY_NULL,
+    PGCOPY_TRAILER,
+    SENSOR_DATA_COLUMNS,
+    TimescaleDBTableHandler,
+    build_filter_conditions,
+    csv_copy_buffer,
+    iso_datetime_text,
+    pg_array_literal,
+    pgcopy_text_field,
+    to_pg_timestamp,
+)
+
+
+def render(composable):
+    """
+    Text of a composed query without a connection, identifiers double-quoted.
+    """
+    if isinstance(composable, sql.Composed):
+        return "".join(render(part) for part in composable.seq)
+    if isinstance(composable, sql.Identifier):
+        return ".".join('"{}"'.format(s) for s in composable.strings)
+    return composable.string
+
+
+# --- Binary COPY ---
+
+
+def test_to_pg_timestamp_epoch():
+    assert to_pg_timestamp(PG_EPOCH) == 0
+    assert to_pg_timestamp("2000-01-01T00:00:01.000002+00:00") == 1000002
+
+
+def test_to_pg_timestamp_naive_is_utc():
+    naive = datetime.datetime(2024, 5, 1, 12, 30, 15, 250)
+    aware = naive.replace(tzinfo=datetime.timezone.utc)
+    assert to_pg_timestamp(naive) == to_pg_timestamp(aware)
+    assert to_pg_timestamp(naive.isoformat()) == to_pg_timestamp(aware)
+
+
+def test_to_pg_timestamp_offsets():
+    utc = to_pg_timestamp("2024-05-01T05:00:00+00:00")
+    assert to_pg_timestamp("2024-05-01T05:00:00Z") == utc
+    assert to_pg_timestamp("2024-05-01T12:00:00+07:00") == utc
+    assert to_pg_timestamp("1999-12-31T23:59:59+00:00") == -1000000
+
+
+def test_pgcopy_text_field():
+    assert pgcopy_text_field(None) == PGCOPY_NULL
+    assert pgcopy_text_field("") == struct.pack(">i", 0)
+    # The length is in bytes, not characters
+    assert pgcopy_text_field("µ") == struct.pack(">i", 2) + "µ".encode("utf-8")
+
+
+def test_binary_copy_buffer():
+    handler = SimpleNamespace(column_names=list(SENSOR_DATA_COLUMNS))
+    rows = [
+        ("2000-01-01T00:00:01+00:00", "pm_001_power", 1.5, None),
+        (datetime.datetime(2000, 1, 1), "iaq_001_co2", 400, "good"),
+    ]
+    buffer = TimescaleDBTableHandler._binary_copy_buffer(handler, rows)
+
+    row_header = struct.pack(">h", 4)
+    expected = (
+        PGCOPY_HEADER
+        + row_header
+        + PGCOPY_INT8_LENGTH + struct.pack(">q", 1000000)
+        + struct.pack(">i", 12) + b"pm_001_power"
+        + PGCOPY_INT8_LENGTH + struct.pack(">d", 1.5)
+        + PGCOPY_NULL
+        + row_header
+        + PGCOPY_INT8_LENGTH + struct.pack(">q", 0)
+        + struct.pack(">i", 11) + b"iaq_001_co2"
+        + PGCOPY_INT8_LENGTH + struct.pack(">d", 400.0)
+        + struct.pack(">i", 4) + b"good"
+        + PGCOPY_TRAILER
+    )
+    assert buffer.read() == expected
+
+
+# --- CSV COPY ---
+
+
+def read_csv(buffer):
+    return list(csv.reader(io.StringIO(buffer.read())))
+
+
+def test_csv_copy_buffer_null_and_empty_string():
+    text = csv_copy_buffer([(None, "", "a")]).read()
+    # None is the NULL marker, an empty string stays an (unquoted) empty field
+    assert text == COPY_NULL + ",,a\r\n"
+
+
+def test_csv_copy_buffer_quoting():
+    rows = [("a,b", 'say "hi"', "two\nlines", 1.5, 0)]
+    assert read_csv(csv_copy_buffer(rows)) == [["a,b", 'say "hi"', "two\nlines", "1.5", "0"]]
+
+
+def test_csv_copy_buffer_non_scalars():
+    rows = [([1, None, 'a"b'], {"k": [1, 2]})]
+    assert read_csv(csv_copy_buffer(rows)) == [['{"1",NULL,"a\\"b"}', '{"k": [1, 2]}']]
+
+
+def test_pg_array_literal():
+    assert pg_array_literal([]) == "{}"
+    assert pg_array_literal(["a b", "c\\d", None]) == '{"a b","c\\\\d",NULL}'
+    assert pg_array_literal([[1, 2], [3, None]]) == '{{"1","2"},{"3",NULL}}'
+
+
+# --- ISO timestamps read back ---
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (None, None),
+        ("2024-05-01 12:00:00+07", "2024-05-01T12:00:00+07:00"),
+        ("2024-05-01 12:00:00.5-03", "2024-05-01T12:00:00.5-03:00"),
+        ("2024-05-01 12:00:00+05:30", "2024-05-01T12:00:00+05:30"),
+        ("2024-05-01 12:00:00", "2024-05-01T12:00:00"),
+        ("2024-05-01 12:00:00.123456", "2024-05-01T12:00:00.123456"),
+        ("12:00:00", "12:00:00"),
+    ],
+)
+def test_iso_datetime_text(value, expected):
+    assert iso_datetime_text(value, None) == expected
+
+
+def test_iso_datetime_text_parses_back():
+    text = iso_datetime_text("2024-05-01 12:00:00+07", None)
+    assert datetime.datetime.fromisoformat(text).utcoffset() == datetime.timedelta(hours=7)
+
+
+# --- Filters of the get/drop RPCs ---
+
+
+COLUMN_TYPES = {"timestamp": "timestamp with time zone", "device_id": "text", "value": "numeric"}
+
+
+def test_filter_binary_operators():
+    conditions, params = build_filter_conditions(
+        {"value": {">": 1, "<=": 5}, "device_id": {"like": "pm_%"}}, "get", COLUMN_TYPES
+    )
+    assert [render(c) for c in conditions] == [
+        '"value" > $1',
+        '"value" <= $2',
+        '"device_id" LIKE $3',
+    ]
+    assert params == [1, 5, "pm_%"]
+
+
+def test_filter_in_is_cast_to_column_type():
+    conditions, params = build_filter_conditions(
+        {
+            "timestamp": {"IN": ["2024-05-01T00:00:00+00:00"]},
+            "value": {"not in": [1, 2]},
+        },
+        "get",
+        COLUMN_TYPES,
+    )
+    assert [render(c) for c in conditions] == [
+        '"timestamp" = ANY($1::timestamp with time zone[])',
+        '"value" <> ALL($2::numeric[])',
+    ]
+    assert params == [["2024-05-01T00:00:00+00:00"], [1, 2]]
+
+
+def test_filter_in_empty_list():
+    conditions, params = build_filter_conditions(
+        {"device_id": {"IN": []}}, "drop", COLUMN_TYPES
+    )
+    # Still one array parameter, the empty array matches no row
+    assert [render(c) for c in conditions] == ['"device_id" = ANY($1::text[])']
+    assert params == [[]]
+
+
+def test_filter_in_unknown_column_type():
+    conditions, params = build_filter_conditions({"other": {"IN": ["a"]}}, "get", {})
+    assert [render(c) for c in conditions] == ['"other" = ANY($1)']
+    assert params == [["a"]]
+
+
+def test_filter_invalid_filters_are_skipped():
+    conditions, params = build_filter_conditions(
+        {
+            "value": {"=": None, "BETWEEN": [1, 2], "IN": "not a list"},
+            "device_id": {"=": "pm_001"},
+        },
+        "get",
+        COLUMN_TYPES,
+    )
+    assert [render(c) for c in conditions] == ['"device_id" = $1']
+    assert params == ["pm_001"]
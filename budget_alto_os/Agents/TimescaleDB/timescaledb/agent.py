@@ -5,23 +5,36 @@ Agent documentation goes here.
 __docformat__ = "reStructuredText"
 
 import os
+import csv
+import hashlib
+import io
 import json
 import logging
 import re
+import struct
 import sys
+import uuid
 import datetime
-from queue import Empty, Queue
-from threading import Thread
+from contextlib import contextmanager
+from functools import lru_cache
+from operator import itemgetter
+from queue import Queue
+from threading import Event, Lock, Thread
 
+import numpy as np
 import pendulum
+import sqlparse
 import yaml
 import psycopg2
 from psycopg2 import sql
-from psycopg2.extras import execute_values
+from psycopg2.extensions import connection as PGConnection
+from psycopg2.extensions import DECIMAL, make_dsn, new_type, register_type
+from psycopg2.extras import Json, RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
 
 from volttron.platform.agent import utils
 from volttron.platform.scheduling import periodic
-from volttron.platform.vip.agent import RPC, Agent
+from volttron.platform.vip.agent import RPC, Agent, Core
 
 import gevent
 
@@ -43,6 +56,392 @@ DEFAULT_SUBSCRIPTION_TOPICS = {
     "command_result": ["command_result"],
 }
 
+# Keys that shouldn't be included into the data sample (e.g. timestamp, device_id, etc.)
+COMMON_KEYS = frozenset(
+    [
+        "timestamp",
+        "unix_timestamp",
+        "week",
+        "month",
+        "year",
+        "device_id",
+        "subdevice_idx",
+        "site_id",
+        "type",
+        "model",
+        "device_name",
+        "subdevice_name",
+    ]
+)
+
+# Number of queued messages of a table that triggers a flush before the periodic one
+FLUSH_QUEUE_DEPTH = 10000
+
+# Queries of query_data_from_timescaledb that can run in a server-side cursor, and the number of
+# rows fetched per round trip
+SELECT_QUERY_RE = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+RPC_QUERY_ITERSIZE = 10000
+
+# Number of rows from which insert_data_to_timescaledb streams the batch with COPY instead of INSERT
+RPC_COPY_MIN_ROWS = 500
+
+# Strings accepted as numeric values, e.g. "21", "-0.5", " 1.2e3 "
+NUMERIC_STRING_RE = re.compile(r"^\s*[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?\s*$")
+
+# Decimals kept for IAQ and power readings, well beyond the sensors' own resolution
+SENSOR_VALUE_DECIMALS = 3
+
+# BRICK point_id format of each reading field per data type, e.g. iaq_001_temp
+SENSOR_POINT_FORMATS = {
+    "iaq": (
+        ("co2", "iaq_{:03d}_co2"),
+        ("temperature", "iaq_{:03d}_temp"),
+        ("humidity", "iaq_{:03d}_humid"),
+    ),
+    "powermeter": (
+        ("power", "pm_{:03d}_power"),
+    ),
+}
+
+
+_utcnow = datetime.datetime.utcnow
+
+# Binary COPY framing: signature, flags and header extension length, then one field count per row
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+PGCOPY_TRAILER = struct.pack(">h", -1)
+PGCOPY_NULL = struct.pack(">i", -1)
+PGCOPY_INT8_LENGTH = struct.pack(">i", 8)
+PG_EPOCH = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Columns of sensor_data, the hot table, which is written with binary COPY
+SENSOR_DATA_COLUMNS = ("timestamp", "point_id", "value", "quality")
+
+# Only the schema in use is read, a table of the same name in another schema would add its columns
+TABLE_COLUMNS_QUERY = (
+    "SELECT column_name FROM information_schema.columns "
+    "WHERE table_name = %s AND table_schema = current_schema() ORDER BY ordinal_position;"
+)
+
+# Column names per (db_name, table_name), so that rebuilding the handlers on reconfigure
+# doesn't read information_schema again
+_table_columns_cache = {}
+
+# Type of each column of a table (without modifiers, e.g. numeric rather than numeric(10,2)),
+# resolved through the search path like the RPC statements themselves
+TABLE_COLUMN_TYPES_QUERY = (
+    "SELECT attname, format_type(atttypid, NULL) FROM pg_attribute "
+    "WHERE attrelid = to_regclass(quote_ident(%s)) AND attnum > 0 AND NOT attisdropped;"
+)
+
+# Column types per (db_name, table_name), see fetch_table_column_types
+_table_column_types_cache = {}
+
+
+def fetch_table_columns(cursor, db_name, table_name):
+    """
+    Column names of a table in ordinal order, read from information_schema once per
+    (db_name, table_name). A missing table is looked up again next time.
+    """
+    key = (db_name, table_name)
+    columns = _table_columns_cache.get(key)
+    if columns is None:
+        cursor.execute(TABLE_COLUMNS_QUERY, (table_name,))
+        columns = [row[0] for row in cursor.fetchall()]
+        if columns:
+            _table_columns_cache[key] = columns
+    return list(columns)
+
+
+def fetch_table_column_types(cursor, db_name, table_name):
+    """
+    Type name of each column of a table, read from pg_attribute once per (db_name, table_name).
+    A missing table is looked up again next time.
+    """
+    key = (db_name, table_name)
+    types = _table_column_types_cache.get(key)
+    if types is None:
+        cursor.execute(TABLE_COLUMN_TYPES_QUERY, (table_name,))
+        types = {row[0]: row[1] for row in cursor.fetchall()}
+        if types:
+            _table_column_types_cache[key] = types
+    return types
+
+
+def iso_datetime_text(value, cursor):
+    """
+    Typecaster keeping timestamps and times as ISO 8601 strings (what datetime.isoformat returns)
+    instead of parsing them into Python objects. PostgreSQL abbreviates whole-hour offsets,
+    e.g. +07 instead of +07:00.
+    """
+    if value is None:
+        return None
+    value = value.replace(" ", "T", 1)
+    if value[-3] in "+-":
+        value += ":00"
+    return value
+
+
+# Operators accepted in the filters of the get/drop RPCs and their SQL, composed once.
+# IN / NOT IN compare against a single array parameter, cast to an array of the column's type.
+FILTER_BINARY_OPERATORS = {
+    op: sql.SQL(op) for op in (">", "<", ">=", "<=", "=", "!=", "LIKE", "NOT LIKE")
+}
+FILTER_SET_OPERATORS = {"IN": sql.SQL("= ANY"), "NOT IN": sql.SQL("<> ALL")}
+
+# Number of prepared statements kept per RPC connection
+MAX_PREPARED_STATEMENTS = 100
+
+# Typecasters of the RPC connections: timestamp, timestamptz, time and timetz use iso_datetime_text,
+# date is already ISO 8601 text
+ISO_DATETIME = new_type((1114, 1184, 1083, 1266), "ISO_DATETIME", iso_datetime_text)
+ISO_DATE = new_type((1082,), "ISO_DATE", lambda value, cursor: value)
+# numeric (e.g. SUM/AVG of integers) is read as float instead of Decimal, which JSON can't encode
+FLOAT_NUMERIC = new_type(
+    DECIMAL.values, "FLOAT_NUMERIC", lambda value, cursor: None if value is None else float(value)
+)
+
+
+class RPCConnection(PGConnection):
+    """
+    Connection of the RPC pool. Dates and times are returned as ISO strings and numerics as floats
+    so that query results can be sent over RPC (JSON) without converting each row.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        register_type(ISO_DATETIME, self)
+        register_type(ISO_DATE, self)
+        register_type(FLOAT_NUMERIC, self)
+        # Names of the server-side prepared statements of this session
+        self.prepared = set()
+
+
+def execute_prepared(cursor, statement: str, params: list):
+    """
+    Run a statement using $1..$n parameters through a server-side prepared statement, so that
+    PostgreSQL parses and plans each statement once per connection instead of on every call.
+    """
+    conn = cursor.connection
+    name = "rpc_" + hashlib.md5(statement.encode("utf-8")).hexdigest()
+    if name not in conn.prepared:
+        # Filter shapes are bounded in practice, start over if a client keeps sending new ones
+        if len(conn.prepared) >= MAX_PREPARED_STATEMENTS:
+            cursor.execute("DEALLOCATE ALL")
+            conn.prepared.clear()
+        cursor.execute(f"PREPARE {name} AS {statement}")
+        conn.prepared.add(name)
+    if params:
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        cursor.execute(f"EXECUTE {name}")
+
+
+def build_filter_conditions(filters: dict, action: str, column_types: dict):
+    """
+    Build the WHERE conditions of the get/drop RPCs from their filters (see
+    Timescaledb.get_data_from_timescaledb). Values are bound as $n parameters so that the
+    statement only depends on the filter shape and can be prepared once (see execute_prepared).
+
+    A list of strings is sent as a text[] array, so the IN / NOT IN arrays are cast to the column's
+    type (column_types, see fetch_table_column_types). Otherwise "= ANY" would compare e.g. a
+    timestamptz column with text.
+
+    Returns:
+        conditions (list): sql.Composed condition per valid filter
+        params (list): Values of the $1..$n parameters
+    """
+    conditions = []
+    params = []
+
+    for col_name, f in filters.items():
+        for oper, value in f.items():
+            if value is None:
+                _log.debug(
+                    f"Invalid value for column [{col_name}] -- value = {value}"
+                )
+                continue
+
+            oper_upper = oper.upper()
+            binary_op = FILTER_BINARY_OPERATORS.get(oper_upper)
+            set_op = FILTER_SET_OPERATORS.get(oper_upper)
+            if binary_op is not None:
+                params.append(value)
+                conditions.append(
+                    sql.SQL("{} {} {}").format(
+                        sql.Identifier(col_name), binary_op, sql.SQL(f"${len(params)}")
+                    )
+                )
+            elif set_op is not None and isinstance(value, list):
+                # The list is bound as one array, whatever its length
+                params.append(value)
+                array = sql.SQL(f"${len(params)}")
+                col_type = column_types.get(col_name)
+                if col_type is not None:
+                    # The type name comes from the catalog, not from the client
+                    array = sql.SQL("{}::{}[]").format(array, sql.SQL(col_type))
+                conditions.append(
+                    sql.SQL("{} {}({})").format(sql.Identifier(col_name), set_op, array)
+                )
+            else:
+                _log.warning(
+                    f"Invalid filter specified for {action} data from TimescaleDB -- {col_name}: {f}"
+                )
+
+    return conditions, params
+
+
+def table_rows(data: list, columns: list):
+    """
+    Values of each dict in data in the order of columns. Rows are extracted with itemgetter (in C),
+    rows leaving columns out fall back to dict.get, which inserts them as NULL.
+    """
+    if len(columns) == 1:
+        return [(row.get(columns[0]),) for row in data]
+    getter = itemgetter(*columns)
+    try:
+        return list(map(getter, data))
+    except KeyError:
+        return [tuple(row.get(col) for col in columns) for row in data]
+
+
+def json_row(row, json_columns):
+    """
+    Row with the dicts of the json_columns indexes wrapped in Json, so that psycopg2 adapts them
+    as JSON for this INSERT only, without a process-wide adapter.
+    """
+    row = list(row)
+    for idx in json_columns:
+        if isinstance(row[idx], dict):
+            row[idx] = Json(row[idx])
+    return row
+
+
+def to_pg_timestamp(ts):
+    """
+    Convert an ISO string or datetime (naive means UTC) into microseconds since 2000-01-01 UTC,
+    the binary COPY encoding of timestamptz.
+    """
+    if isinstance(ts, str):
+        ts = datetime.datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=datetime.timezone.utc)
+    delta = ts - PG_EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+# NULL marker of the CSV COPY streams, so that empty strings are stored as empty strings
+COPY_NULL = "\\N"
+CSV_COPY_OPTIONS = "(FORMAT CSV, NULL '\\N')"
+
+
+def pg_array_literal(values):
+    """
+    PostgreSQL array literal of a list, e.g. {"1","a b",NULL}. Elements are quoted and
+    converted by the column's element type.
+    """
+    elements = []
+    for val in values:
+        if val is None:
+            elements.append("NULL")
+        elif isinstance(val, list):
+            elements.append(pg_array_literal(val))
+        else:
+            elements.append('"' + str(val).replace("\\", "\\\\").replace('"', '\\"') + '"')
+    return "{" + ",".join(elements) + "}"
+
+
+def copy_csv_value(val):
+    """
+    Text of a list or dict in a CSV COPY stream, matching what INSERT stores for it: lists
+    become arrays (as psycopg2 adapts them) and dicts JSON.
+    """
+    if isinstance(val, list):
+        return pg_array_literal(val)
+    return json.dumps(val)
+
+
+def csv_copy_buffer(rows):
+    """
+    CSV COPY stream of rows, to be read with CSV_COPY_OPTIONS. None is written as COPY_NULL.
+    A text value equal to COPY_NULL would be read as NULL too.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        [
+            COPY_NULL
+            if val is None
+            else copy_csv_value(val)
+            if type(val) in (list, dict)
+            else val
+            for val in row
+        ]
+        for row in rows
+    )
+    buffer.seek(0)
+    return buffer
+
+
+def pgcopy_text_field(val):
+    """
+    Length-prefixed UTF-8 field of a binary COPY row, or the NULL marker.
+    """
+    if val is None:
+        return PGCOPY_NULL
+    encoded = str(val).encode("utf-8")
+    return struct.pack(">i", len(encoded)) + encoded
+
+
+@lru_cache(maxsize=1024)
+def sensor_point_ids(data_type, device_num):
+    """
+    BRICK point_ids of a device as (reading field, point_id) pairs, formatted once per device.
+    data_type must be a key of SENSOR_POINT_FORMATS, the callers check it so that only devices
+    mapped to sensor_data are cached.
+    """
+    return tuple(
+        (point_type, point_format.format(int(device_num)))
+        for point_type, point_format in SENSOR_POINT_FORMATS[data_type]
+    )
+
+
+def split_sql_statements(sql_content: str):
+    """
+    Split a SQL script into statements. Unlike a plain split on ";", sqlparse keeps semicolons
+    inside string literals and $$ function bodies. Comment-only chunks are dropped.
+    """
+    return [
+        statement
+        for statement in sqlparse.split(sql_content)
+        if sqlparse.format(statement, strip_comments=True).strip()
+    ]
+
+
+def quantize_sensor_value(value):
+    """
+    Round float readings to SENSOR_VALUE_DECIMALS, dropping float noise such as 23.400000000000002.
+    Other values are left for TimescaleDBTableHandler.is_valid_value to check.
+    """
+    if isinstance(value, float):
+        return round(value, SENSOR_VALUE_DECIMALS)
+    return value
+
+
+def from_epoch_timestamp(ts):
+    """
+    Convert an epoch timestamp in seconds or milliseconds into a UTC datetime. Other values, e.g. ISO
+    strings, are returned as is.
+    """
+    if not isinstance(ts, (int, float)):
+        return ts
+    # check if timestamp is seconds or milliseconds
+    if ts >= 10000000000:
+        ts = ts / 1000
+    try:
+        # stdlib datetime is much cheaper to build than pendulum.DateTime
+        return datetime.datetime.fromtimestamp(ts, tz=datetime.timezone.utc)
+    except (OverflowError, OSError, ValueError):
+        return ts
+
 
 class TimescaleDBTableHandler(object):
     def __init__(self, controller, table_name):
@@ -51,18 +450,34 @@ class TimescaleDBTableHandler(object):
 
         self.build_table()  # Create new table if table_name does not exist in TimescaleDB
         self.column_names = self.get_table_columns()
-        # Queue of data entries which will be logged into Database
-        self.data_queue = Queue()
-
-        # Thread for handling data logging
-        self.log_thread = Thread(
-            target=self._flush_thread,
-            name=f"timescaledb_flush_{self.table_name}",
-            daemon=True,
+        # Column lookups used for every logged message, computed once per table
+        self._column_set = frozenset(self.column_names)
+        # Old DeviceAgent convention, one (datapoint, value) row per data point (Case 1 of log_data)
+        self._is_kv_schema = "datapoint" in self._column_set and "value" in self._column_set
+        # Positions of the datapoint/value columns, filled per datapoint in Case 1 of log_data
+        self._datapoint_idx = (
+            self.column_names.index("datapoint") if "datapoint" in self._column_set else None
         )
-        self.log_thread.start()
-
-        self.do_flush = False
+        self._value_idx = (
+            self.column_names.index("value") if "value" in self._column_set else None
+        )
+        self._copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH " + CSV_COPY_OPTIONS).format(
+            sql.Identifier(self.table_name),
+            sql.SQL(", ").join(map(sql.Identifier, self.column_names)),
+        )
+        # sensor_data rows are sent with binary COPY instead of CSV (see self._binary_copy_buffer)
+        self._binary_copy_query = None
+        if self._column_set == frozenset(SENSOR_DATA_COLUMNS):
+            self._binary_copy_query = sql.SQL(
+                "COPY {} ({}) FROM STDIN WITH (FORMAT BINARY)"
+            ).format(
+                sql.Identifier(self.table_name),
+                sql.SQL(", ").join(map(sql.Identifier, self.column_names)),
+            )
+        # Rows of self.log_sensor_rows can be queued as is when the columns are in this order
+        self._is_sensor_schema = tuple(self.column_names) == SENSOR_DATA_COLUMNS
+        # Queue of data entries which will be logged into Database by the controller's flush thread
+        self.data_queue = Queue()
 
     @staticmethod
     def is_valid_value(val):
@@ -75,22 +490,18 @@ class TimescaleDBTableHandler(object):
         Returns:
             bool: True if the value is valid (numeric or convertible to numeric), False otherwise
         """
-        if isinstance(val, (int, float)):
+        value_type = type(val)
+        if value_type is float or value_type is int or value_type is bool:
             return True
-        if isinstance(val, bool):
-            return True
-        if isinstance(val, str):
-            # Try to convert string to float if it represents a number
-            try:
-                float(val)
-                return True
-            except ValueError:
-                return False
-        return False
+        if value_type is str:
+            # Match numeric strings instead of raising and catching ValueError from float()
+            return NUMERIC_STRING_RE.match(val) is not None
+        # e.g. numpy scalars
+        return isinstance(val, (int, float))
 
     @property
     def connection_string(self):
-        return f"dbname={self.controller.db_name} user={self.controller.db_user} password={self.controller.db_password} host={self.controller.db_host} port={self.controller.db_port}"
+        return self.controller.connection_string
 
     def build_table(self):
         """
@@ -114,6 +525,8 @@ class TimescaleDBTableHandler(object):
                 gevent.sleep(15)
                 connection = psycopg2.connect(self.connection_string)
 
+            # Each statement commits on its own, without a separate COMMIT round trip
+            connection.autocommit = True
             cursor = connection.cursor()
             table_sql = os.path.join(
                 os.path.dirname(__file__),
@@ -126,19 +539,16 @@ class TimescaleDBTableHandler(object):
                 # Replace placeholders with actual values
                 sql_content = self.controller.replace_placeholders(sql_content)
                 # Split and execute queries
-                queries = sql_content.split(";")
-                for query in queries:
-                    if query.strip():
-                        try:
-                            cursor.execute(query + ";")
-                            connection.commit()
-                        except Exception as e:
-                            _log.error(f"Error executing query: {e}")
-                            self.controller.custom_health.update_health(
-                                status="BAD",
-                                context=f"Error executing query: {e}",
-                            )
-                            continue
+                for query in split_sql_statements(sql_content):
+                    try:
+                        cursor.execute(query)
+                    except Exception as e:
+                        _log.error(f"Error executing query: {e}")
+                        self.controller.custom_health.update_health(
+                            status="BAD",
+                            context=f"Error executing query: {e}",
+                        )
+                        continue
             self.controller.custom_health.update_health(
                 status="GOOD", context="Table created successfully"
             )
@@ -155,109 +565,170 @@ class TimescaleDBTableHandler(object):
 
     def log_data(self, data: dict):
         """
-        Log data into self.data_queue
-        """
-        # Keys that shouldn't be included into the data sample (e.g. timestamp, device_id, etc.)
-        COMMON_KEYS = [
-            "timestamp",
-            "unix_timestamp",
-            "week",
-            "month",
-            "year",
-            "device_id",
-            "subdevice_idx",
-            "site_id",
-            "type",
-            "model",
-            "device_name",
-            "subdevice_name",
-        ]
-
+        Log data into self.data_queue, as a list of row tuples ordered by self.column_names
+        """
         # If timestamp exists in data. Make sure that the data type is float (timestamp in milliseconds) so TimescaleDB will
         # correctly parse it
-        if "timestamp" in data.keys():
-            if "datetime" in data.keys():
+        if "timestamp" in data:
+            if "datetime" in data:
                 data["timestamp"] = data["datetime"]
                 del data["datetime"]
-        if "location" in data.keys():
+        if "location" in data:
             data["site_id"] = data["location"]
             del data["location"]
 
         # Case 1: Old convention from DeviceAgent
-        if (
-            ("datapoint" in self.column_names)
-            and ("value" in self.column_names)
-            and ("datapoint" not in data)
-            and ("value" not in data)
-        ):
-            sample_template = {
-                col: data[col]
-                for col in list(set(self.column_names) - set(["datapoint", "value"]))
-            }
+        if self._is_kv_schema and ("datapoint" not in data) and ("value" not in data):
+            base_row = [data.get(col, None) for col in self.column_names]
 
-            additional_points = list(
-                set(data.keys()) - set(self.column_names) - set(COMMON_KEYS)
-            )
-            for k in additional_points:
-                sample = sample_template.copy()
-                sample["datapoint"] = k
-                sample["value"] = data[k]
+            # Rows of all data points are queued together, one put per message
+            rows = []
+            for k, v in data.items():
+                if k in self._column_set or k in COMMON_KEYS:
+                    continue
                 # Only add valid data points
-                if self.is_valid_value(sample["value"]):
-                    self.data_queue.put_nowait(sample)
+                if self.is_valid_value(v):
+                    row = base_row.copy()
+                    row[self._datapoint_idx] = k
+                    row[self._value_idx] = float(v) if isinstance(v, bool) else v
+                    rows.append(tuple(row))
                 else:
-                    _log.debug(f"Skipping invalid value for datapoint {k}: {data[k]}")
+                    _log.debug(f"Skipping invalid value for datapoint {k}: {v}")
+            if rows:
+                self._enqueue(rows)
         # Case 2: Agent health
         elif self.table_name == "agent_status":
-            self.data_queue.put_nowait(
-                {
-                    "timestamp": data["timestamp"],
-                    "site_id": data["site_id"],
-                    "agent_id": data["agent_id"],
-                    "status": data["status"],
-                    "context": data["context"],
-                }
+            agent_status = {
+                "timestamp": data["timestamp"],
+                "site_id": data["site_id"],
+                "agent_id": data["agent_id"],
+                "status": data["status"],
+                "context": data["context"],
+            }
+            self._enqueue(
+                [tuple(agent_status.get(col, None) for col in self.column_names)]
             )
         else:
-            sample_template = {col: data[col] for col in list(set(self.column_names))}
-            sample = sample_template.copy()
-            try:
-                # check if timestamp is seconds or milliseconds
-                if sample["timestamp"] < 10000000000:
-                    sample["timestamp"] = pendulum.from_timestamp(
-                        sample["timestamp"], tz="UTC"
-                    )
-                else:
-                    sample["timestamp"] = pendulum.from_timestamp(
-                        sample["timestamp"] / 1000, tz="UTC"
-                    )
-            except Exception as e:
-                # _log.debug(f"Error parsing timestamp: {e}")
-                pass
+            row = []
+            for col in self.column_names:
+                v = data.get(col, None)
+                if col == "timestamp":
+                    v = from_epoch_timestamp(v)
 
-            # if any of the values in data is list of dictionaries, convert it 'JSONB'
-            for k, v in sample.items():
+                # if any of the values in data is list of dictionaries, convert it 'JSONB'
                 if isinstance(v, list) or isinstance(v, dict):
-                    sample[k] = json.dumps(v)
-                elif k == "value" and not self.is_valid_value(v):
-                    _log.debug(f"Skipping invalid value: {v}")
-                    return
-            self.data_queue.put_nowait(sample)
+                    v = json.dumps(v)
+                elif col == "value":
+                    if not self.is_valid_value(v):
+                        _log.debug(f"Skipping invalid value: {v}")
+                        return
+                    if isinstance(v, bool):
+                        v = float(v)
+                row.append(v)
+            self._enqueue([tuple(row)])
+
+    def log_sensor_rows(self, timestamp, readings):
+        """
+        Fast path of self.log_data for sensor_data. readings are (point_id, value) pairs already mapped
+        to BRICK point_ids and sharing one timestamp, so only the value check is left per row.
+        """
+        if not self._is_sensor_schema:
+            for point_id, value in readings:
+                self.log_data(
+                    {"timestamp": timestamp, "point_id": point_id, "value": value, "quality": "good"}
+                )
+            return
 
-    def flush_data(self):
-        """Change the flag to flush data into TimescaleDB in the next loop in self._flush_thread"""
-        self.do_flush = True
+        timestamp = from_epoch_timestamp(timestamp)
+        rows = []
+        for point_id, value in readings:
+            if isinstance(value, bool):
+                value = float(value)
+            elif not self.is_valid_value(value):
+                _log.debug(f"Skipping invalid value for {point_id}: {value}")
+                continue
+            rows.append((timestamp, point_id, value, "good"))
+        if rows:
+            self._enqueue(rows)
+
+    def _enqueue(self, rows):
+        """
+        Queue a message's rows for the next flush. Once the queue is deep, flush right away
+        instead of waiting for the periodic flush.
+        """
+        self.data_queue.put_nowait(rows)
+        if self.data_queue.qsize() >= FLUSH_QUEUE_DEPTH:
+            self.controller.flush_now()
+
+    def drain_rows(self):
+        """
+        Take every row queued so far, under a single lock acquisition and without blocking.
+        Rows are already ordered by self.column_names (see self.log_data).
+        """
+        with self.data_queue.mutex:
+            batches = list(self.data_queue.queue)
+            self.data_queue.queue.clear()
+        rows = []
+        for batch in batches:
+            rows.extend(batch)
+        return rows
+
+    def copy_rows(self, cursor, rows):
+        """
+        Write rows into the table with COPY FROM STDIN on the given cursor. The caller commits.
+        """
+        if self._binary_copy_query is not None:
+            try:
+                buffer = self._binary_copy_buffer(rows)
+            except (TypeError, ValueError) as e:
+                _log.debug(f"Falling back to CSV COPY for {self.table_name}: {e}")
+            else:
+                cursor.copy_expert(self._binary_copy_query, buffer)
+                return
+
+        # COPY streams the whole batch as CSV, skipping per-row INSERT parsing
+        cursor.copy_expert(self._copy_query, csv_copy_buffer(rows))
+
+    def _binary_copy_buffer(self, rows):
+        """
+        Encode sensor_data rows as a binary COPY stream. Rows are split into columns first so that
+        timestamps (int8 microseconds) and values (float8) are converted as whole arrays.
+        """
+        fields = []
+        for col, values in zip(self.column_names, zip(*rows)):
+            if col == "timestamp":
+                encoded = np.fromiter(
+                    (to_pg_timestamp(ts) for ts in values), dtype=np.int64, count=len(rows)
+                ).astype(">i8").tobytes()
+            elif col == "value":
+                encoded = np.asarray(values, dtype=np.float64).astype(">f8").tobytes()
+            else:
+                fields.append([pgcopy_text_field(val) for val in values])
+                continue
+            fields.append(
+                [PGCOPY_INT8_LENGTH + encoded[i : i + 8] for i in range(0, len(encoded), 8)]
+            )
+
+        row_header = struct.pack(">h", len(self.column_names))
+        buffer = io.BytesIO()
+        buffer.write(PGCOPY_HEADER)
+        for row_fields in zip(*fields):
+            buffer.write(row_header)
+            buffer.write(b"".join(row_fields))
+        buffer.write(PGCOPY_TRAILER)
+        buffer.seek(0)
+        return buffer
 
     def query_data(self, query_string: str):
         """
         Query data from TimescaleDB with specified query string.
         """
-        with psycopg2.connect(self.connection_string) as conn:
-            with conn.cursor() as cursor:
+        with self.controller.conn_lock, self.controller.get_connection() as conn:
+            # RealDictCursor builds each row's dict while fetching, no second pass over the rows
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
                 try:
                     cursor.execute(query_string)
-                    columns = [desc[0] for desc in cursor.description]
-                    data = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                    data = cursor.fetchall()
                     self.controller.custom_health.update_health(
                         status="GOOD",
                         context=f"Data queried successfully: {query_string}",
@@ -273,7 +744,7 @@ class TimescaleDBTableHandler(object):
         """
         Execute given SQL string. Return nothing
         """
-        with psycopg2.connect(self.connection_string) as conn:
+        with self.controller.conn_lock, self.controller.get_connection() as conn:
             with conn.cursor() as cursor:
                 try:
                     cursor.execute(sql_string)
@@ -293,7 +764,7 @@ class TimescaleDBTableHandler(object):
         """
         Execute given SQL string with multiple data. Return nothing
         """
-        with psycopg2.connect(self.connection_string) as conn:
+        with self.controller.conn_lock, self.controller.get_connection() as conn:
             with conn.cursor() as cursor:
                 try:
                     cursor.executemany(sql_string, data)
@@ -309,116 +780,15 @@ class TimescaleDBTableHandler(object):
                         context=f"Error `{e}` when executing command {sql_string}",
                     )
 
-    def _flush_thread(self):
-        """
-        A thread for handling data logging into TimescaleDB. The INSERT command will be executed every time self.do_flush
-        is changed to True by the periodically-called function self.flush_data
-        """
-        time_to_die = False
-        # Gather the queued data
-        lod = []
-        while True:
-            while True:
-                try:
-                    data = self.data_queue.get(timeout=1)
-                    self.data_queue.task_done()
-                    if data == "Die":
-                        time_to_die = True
-                        break
-
-                    # Preporcess lod to convert boolean values to float
-                    if "value" in data.keys() and isinstance(data["value"], bool):
-                        data["value"] = float(data["value"])
-
-                    lod.append([data.get(col, None) for col in self.column_names])
-
-                    if len(lod) >= 1000:
-                        break
-
-                except Empty:
-                    break
-                except Exception as e:
-                    _log.debug(f"Queue exception: {e}")
-                    break
-
-            if self.do_flush and lod:
-                query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
-                    sql.Identifier(self.table_name),
-                    sql.SQL(", ").join(map(sql.Identifier, self.column_names)),
-                )
-                max_retries = 3
-                base_delay = 1  # seconds
-
-                for retry_count in range(max_retries):
-                    try:
-                        with psycopg2.connect(self.connection_string) as conn:
-                            with conn.cursor() as cursor:
-                                execute_values(cursor, query, lod)
-                                conn.commit()
-                                _log.info(
-                                    f"Inserted {len(lod)} rows into {self.table_name}."
-                                )
-                                self.controller.custom_health.update_health(
-                                    status="GOOD",
-                                    context=f"Inserted {len(lod)} rows into {self.table_name}.",
-                                )
-                                break
-
-                    except (
-                        psycopg2.OperationalError,
-                        psycopg2.InterfaceError,
-                        psycopg2.DatabaseError,
-                    ) as e:
-                        # Handle connection-related errors with retry
-                        # exponential backoff
-                        delay = base_delay * (2**retry_count)
-                        _log.warning(
-                            f"Database connection error (attempt {retry_count + 1}/{max_retries}): {e}"
-                        )
-                        _log.warning(f"Retrying in {delay} seconds...")
-
-                        # Ensure connection is closed before retry
-                        if "conn" in locals():
-                            try:
-                                conn.close()
-                            except Exception:
-                                pass
-
-                        gevent.sleep(delay)
-
-                        if retry_count == max_retries - 1:
-                            _log.critical(
-                                f"Failed to insert data after {max_retries} attempts: {e}"
-                            )
-                            self.controller.custom_health.update_health(
-                                status="BAD",
-                                context=f"Failed to insert data after {max_retries} attempts: {e}",
-                            )
-
-                    except Exception as e:
-                        # Handle other errors (like syntax errors) without retry
-                        _log.critical(f"Data could not be saved due to error: {e}")
-                        self.controller.custom_health.update_health(
-                            status="BAD", context=f"Data could not be saved: {e}"
-                        )
-                        break
-
-                    finally:
-                        self.do_flush = False
-                        lod = []
-            if time_to_die:
-                break
-
     def get_table_columns(self):
         """
         Get the columns of the table.
         """
-        connection = psycopg2.connect(self.connection_string)
-        cursor = connection.cursor()
-        query = f"SELECT column_name FROM information_schema.columns WHERE table_name = '{self.table_name}';"
-        cursor.execute(query)
-        columns = [row[0] for row in cursor.fetchall()]
-        return columns
+        with self.controller.conn_lock, self.controller.get_connection() as conn:
+            with conn.cursor() as cursor:
+                return fetch_table_columns(
+                    cursor, self.controller.db_name, self.table_name
+                )
 
 
 def timescaledb(config_path, **kwargs):
@@ -477,8 +847,25 @@ class Timescaledb(Agent):
         self.db_name = db_name
         self.db_user = db_user
         self.db_password = db_password
+        self._conninfo = self._make_conninfo()
 
         self.tables = dict()
+        # (column names, INSERT statement, row template) per table for insert_data_to_timescaledb
+        self._insert_queries = dict()
+
+        # Long-lived connection shared by the flush thread and the table handlers' queries,
+        # so that a flush does not pay for a new connect/auth handshake
+        self._conn = None
+        self.conn_lock = Lock()
+        # Pool of connections borrowed by the RPC methods, opened on the first call
+        self._pool = None
+
+        # Thread writing the queued rows of all tables, woken up by self._flush_data
+        self._flush_event = Event()
+        self.log_thread = Thread(
+            target=self._flush_thread, name="timescaledb_flush", daemon=True
+        )
+        self.log_thread.start()
 
         self.default_config = default_config
 
@@ -539,6 +926,7 @@ class Timescaledb(Agent):
             self.db_user = agent_config.get("db_user", "postgres")
             self.db_password = agent_config.get("db_password", "Magicalmint@636")
             self.retention_interval = agent_config.get("retention_interval", "1 year")
+            self._conninfo = self._make_conninfo()
         except ValueError as e:
             _log.error("ERROR PROCESSING CONFIGURATION: {}".format(e))
             self.custom_health.update_health(
@@ -546,9 +934,15 @@ class Timescaledb(Agent):
             )
             return
 
+        # Database settings may have changed, reopen the shared connection on next use
+        self.reconnect()
         self.tables = dict()
-        self._register_tables()
-        self._setup_continuous_aggregations()
+        self._insert_queries = dict()
+        # Table and continuous aggregation setup blocks on psycopg2 (and sleeps between connection
+        # retries), so it runs in gevent's native threadpool to keep the hub and heartbeat running
+        threadpool = gevent.get_hub().threadpool
+        threadpool.apply(self._register_tables)
+        threadpool.apply(self._setup_continuous_aggregations)
 
         self.subscribed_topics = []
         self._create_subscriptions(list(DEFAULT_SUBSCRIPTION_TOPICS.values()))
@@ -556,12 +950,215 @@ class Timescaledb(Agent):
         # Set up period for flushing and writing data into database
         self.core.schedule(periodic(5), self._flush_data)
 
+    def _make_conninfo(self):
+        """
+        Connection string of the database settings, built once per configuration. make_dsn
+        also quotes values containing spaces or quotes.
+        """
+        return make_dsn(
+            dbname=self.db_name,
+            user=self.db_user,
+            password=self.db_password,
+            host=self.db_host,
+            port=self.db_port,
+        )
+
+    @property
+    def connection_string(self):
+        return self._conninfo
+
+    def get_connection(self):
+        """
+        Return the agent's persistent connection, opening it if needed. Callers hold self.conn_lock.
+        """
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg2.connect(
+                self.connection_string, keepalives=1, keepalives_idle=30
+            )
+        return self._conn
+
+    def close_connection(self):
+        """
+        Drop the agent's persistent connection, the next call to self.get_connection opens a new one.
+        The RPC pool is left alone.
+        """
+        with self.conn_lock:
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except Exception:
+                    pass
+            self._conn = None
+
+    def reconnect(self):
+        """
+        Drop the current connection and the RPC pool, the next call to self.get_connection or
+        self.rpc_connection opens new ones.
+        """
+        self.close_connection()
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+    @contextmanager
+    def rpc_connection(self):
+        """
+        Borrow a connection from the RPC pool for one transaction and give it back once done.
+        """
+        if self._pool is None:
+            self._pool = ThreadedConnectionPool(
+                minconn=2,
+                maxconn=10,
+                dsn=self.connection_string,
+                connection_factory=RPCConnection,
+            )
+        pool = self._pool
+        conn = pool.getconn()
+        failed = False
+        try:
+            with conn:
+                yield conn
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # A connection that failed is discarded instead of being handed out again, so that
+            # it doesn't carry a broken session (e.g. its prepared statements) into the next call
+            pool.putconn(conn, close=failed or bool(conn.closed))
+
+    @Core.receiver("onstop")
+    def onstop(self, sender, **kwargs):
+        """
+        Close the database connections when the agent stops.
+        """
+        self.reconnect()
+
     def _flush_data(self):
         """
         Periodically flush all data already logged into data queue and write into TimescaleDB
         """
-        for table in self.tables.values():
-            table.flush_data()
+        self.flush_now()
+
+    def flush_now(self):
+        """
+        Wake up the flush thread to write all queued data, e.g. when a table's queue is deep.
+        """
+        self._flush_event.set()
+
+    def _flush_thread(self):
+        """
+        A thread for handling data logging into TimescaleDB. Every time self._flush_event is set by the
+        periodically-called function self._flush_data, the rows queued by all tables are copied on one connection
+        and committed together, instead of one connection and commit per table. Each table is copied under its
+        own savepoint, so rows rejected by the database only hold back (and are retried for) their own table.
+        """
+        pending = dict()
+        while True:
+            self._flush_event.wait()
+            self._flush_event.clear()
+
+            for table_name, table in list(self.tables.items()):
+                rows = table.drain_rows()
+                if rows:
+                    pending.setdefault(table_name, []).extend(rows)
+            if not pending:
+                continue
+
+            max_retries = 3
+            base_delay = 1  # seconds
+
+            for retry_count in range(max_retries):
+                failed = dict()
+                try:
+                    with self.conn_lock, self.get_connection() as conn:
+                        with conn.cursor() as cursor:
+                            for table_name, rows in pending.items():
+                                table = self.tables.get(table_name)
+                                if table is None:
+                                    continue
+                                # Rows rejected by the database (bad data, constraints) only roll
+                                # back their own table, the other tables are still committed
+                                cursor.execute("SAVEPOINT flush_table")
+                                try:
+                                    table.copy_rows(cursor, rows)
+                                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                                    raise
+                                except psycopg2.DatabaseError as e:
+                                    cursor.execute("ROLLBACK TO SAVEPOINT flush_table")
+                                    failed[table_name] = e
+                                else:
+                                    cursor.execute("RELEASE SAVEPOINT flush_table")
+                        conn.commit()
+
+                except (
+                    psycopg2.OperationalError,
+                    psycopg2.InterfaceError,
+                    psycopg2.DatabaseError,
+                ) as e:
+                    # Handle connection-related errors with retry
+                    # exponential backoff
+                    delay = base_delay * (2**retry_count)
+                    _log.warning(
+                        f"Database connection error (attempt {retry_count + 1}/{max_retries}): {e}"
+                    )
+                    _log.warning(f"Retrying in {delay} seconds...")
+
+                    # Ensure connection is closed before retry. The RPC pool may be in use and
+                    # is not touched.
+                    self.close_connection()
+
+                    gevent.sleep(delay)
+
+                    if retry_count == max_retries - 1:
+                        _log.critical(
+                            f"Failed to insert data after {max_retries} attempts: {e}"
+                        )
+                        self.custom_health.update_health(
+                            status="BAD",
+                            context=f"Failed to insert data after {max_retries} attempts: {e}",
+                        )
+                    continue
+
+                except Exception as e:
+                    # Handle other errors (like syntax errors) without retry
+                    _log.critical(f"Data could not be saved due to error: {e}")
+                    self.custom_health.update_health(
+                        status="BAD", context=f"Data could not be saved: {e}"
+                    )
+                    break
+
+                inserted = ", ".join(
+                    f"{len(rows)} rows into {table_name}"
+                    for table_name, rows in pending.items()
+                    if table_name not in failed
+                )
+                if inserted:
+                    _log.info(f"Inserted {inserted}.")
+                    self.custom_health.update_health(
+                        status="GOOD", context=f"Inserted {inserted}."
+                    )
+                if not failed:
+                    break
+
+                # Only the rows of the tables that failed are tried again
+                pending = {table_name: pending[table_name] for table_name in failed}
+                errors = "; ".join(f"{table_name}: {e}" for table_name, e in failed.items())
+                if retry_count == max_retries - 1:
+                    _log.critical(
+                        f"Dropped rows after {max_retries} attempts: {errors}"
+                    )
+                    self.custom_health.update_health(
+                        status="BAD",
+                        context=f"Dropped rows after {max_retries} attempts: {errors}",
+                    )
+                else:
+                    delay = base_delay * (2**retry_count)
+                    _log.warning(
+                        f"Rows rejected (attempt {retry_count + 1}/{max_retries}), retrying in {delay} seconds: {errors}"
+                    )
+                    gevent.sleep(delay)
+
+            pending = dict()
 
     def _register_tables(self):
         """
@@ -575,14 +1172,10 @@ class Timescaledb(Agent):
         Replace placeholders in the SQL content with actual values
         """
         _log.info("Replacing placeholders...")
-        sql_content = sql_content.replace("timezone_placeholder", self.timezone)
-        _log.info(f"Replaced timezone placeholder with {self.timezone}")
-        sql_content = sql_content.replace(
-            "retention_interval_placeholder", self.retention_interval
-        )
-        _log.info(
-            f"Replaced retention interval placeholder with {self.retention_interval}"
-        )
+        placeholders = {
+            "timezone_placeholder": self.timezone,
+            "retention_interval_placeholder": self.retention_interval,
+        }
         if self.business_hours and all(
             value is not None for value in self.business_hours.values()
         ):
@@ -592,52 +1185,49 @@ class Timescaledb(Agent):
             operation_hours = (
                 business_hours_start.diff(business_hours_end).in_minutes() / 60
             )
-            business_hours_start_str = (
+            placeholders["business_hours_start"] = (
                 f"{business_hours_start.hour:02d}:{business_hours_start.minute:02d}:00"
             )
-            business_hours_end_str = (
+            placeholders["business_hours_end"] = (
                 f"{business_hours_end.hour:02d}:{business_hours_end.minute:02d}:00"
             )
-            sql_content = sql_content.replace(
-                "business_hours_start", business_hours_start_str
-            )
-            sql_content = sql_content.replace(
-                "business_hours_end", business_hours_end_str
-            )
-            sql_content = sql_content.replace(
-                "operation_hours", f"{operation_hours:.2f}"
-            )
+            placeholders["operation_hours"] = f"{operation_hours:.2f}"
 
             # Create initial start time using proper Pendulum methods
             initial_start = pendulum.now(tz=self.timezone).subtract(days=1)
             initial_start = initial_start.set(
                 hour=business_hours_end.hour, minute=5, second=0
             )
-            sql_content = sql_content.replace(
-                "initial_start_placeholder", initial_start.to_iso8601_string()
-            )
         else:
             _log.info(
                 "No business hours specified in config, using whole day as business hours"
             )
             # whole day is business hours
-            sql_content = sql_content.replace("business_hours_start", "00:00:00")
-            sql_content = sql_content.replace("business_hours_end", "23:59:59")
-            sql_content = sql_content.replace("operation_hours", "24")
+            placeholders["business_hours_start"] = "00:00:00"
+            placeholders["business_hours_end"] = "23:59:59"
+            placeholders["operation_hours"] = "24"
 
             # Create initial start time using proper Pendulum methods
             initial_start = pendulum.now(tz=self.timezone).subtract(days=1)
             initial_start = initial_start.set(hour=0, minute=5, second=0)
-            sql_content = sql_content.replace(
-                "initial_start_placeholder", initial_start.to_iso8601_string()
-            )
+        placeholders["initial_start_placeholder"] = initial_start.to_iso8601_string()
+
+        # Substitute every placeholder in a single pass over the SQL instead of one copy per placeholder
+        pattern = re.compile(
+            "|".join(re.escape(key) for key in sorted(placeholders, key=len, reverse=True))
+        )
+        sql_content = pattern.sub(lambda match: placeholders[match.group(0)], sql_content)
+        _log.info(
+            f"Replaced timezone placeholder with {self.timezone} and "
+            f"retention interval placeholder with {self.retention_interval}"
+        )
         return sql_content
 
     def _setup_continuous_aggregations(self):
         """
         Setup continuous aggregations from .sql files (for calculated data).
         """
-        connection_string = f"dbname={self.db_name} user={self.db_user} password={self.db_password} host={self.db_host} port={self.db_port}"
+        connection_string = self.connection_string
         cursor = None
         try:
             connection = psycopg2.connect(connection_string)
@@ -648,6 +1238,8 @@ class Timescaledb(Agent):
             )
             gevent.sleep(15)
             connection = psycopg2.connect(connection_string)
+        # Each statement commits on its own, continuous aggregates can't be created in a transaction block
+        connection.autocommit = True
         cursor = connection.cursor()
 
         try:
@@ -664,19 +1256,16 @@ class Timescaledb(Agent):
                     # Replace placeholders with actual values
                     sql_content = self.replace_placeholders(sql_content)
                     # Split and execute queries
-                    queries = sql_content.split(";")
-                    for query in queries:
-                        if query.strip():  # Ensure the query is not empty
-                            try:
-                                cursor.execute(query + ";")
-                                connection.commit()
-                            except Exception as e:
-                                _log.error(f"Error executing query in {table_sql}: {e}")
-                                self.custom_health.update_health(
-                                    status="BAD",
-                                    context=f"Error executing query in {table_sql}: {e}",
-                                )
-                                continue
+                    for query in split_sql_statements(sql_content):
+                        try:
+                            cursor.execute(query)
+                        except Exception as e:
+                            _log.error(f"Error executing query in {table_sql}: {e}")
+                            self.custom_health.update_health(
+                                status="BAD",
+                                context=f"Error executing query in {table_sql}: {e}",
+                            )
+                            continue
                 self.custom_health.update_health(
                     status="GOOD",
                     context=f"Successfully setup continuous aggregations for {table_sql}",
@@ -717,70 +1306,50 @@ class Timescaledb(Agent):
         Callback for all pubsub messages. Routes all IAQ and powermeter data to sensor_data table
         using BRICK point_id.
         """
-        import datetime
-
         topic_parts = topic.split("/")
         if not topic_parts:
             return
 
         # Determine type and id from topic
         data_type = topic_parts[0]  # "iaq" or "powermeter"
+        if data_type not in SENSOR_POINT_FORMATS or not isinstance(message, dict):
+            # Not a topic we care about (heartbeats, datalogger, ...)
+            return
         device_num = topic_parts[1] if len(topic_parts) > 1 else None
 
-        # Map to point_ids
-        if data_type == "iaq" and device_num is not None:
-            # Expect message to have co2, temperature, humidity
-            for point_type in ["co2", "temperature", "humidity"]:
-                if point_type in message:
-                    point_id = f"iaq_{int(device_num):03d}_{'humid' if point_type == 'humidity' else point_type}"
-                    data_row = {
-                        "timestamp": message.get("timestamp", datetime.datetime.utcnow().isoformat()),
-                        "point_id": point_id,
-                        "value": message[point_type],
-                        "quality": "good"
-                    }
-                    self.tables["sensor_data"].log_data(data_row)
-        elif data_type == "powermeter" and device_num is not None:
-            if "power" in message:
-                point_id = f"pm_{int(device_num):03d}_power"
-                data_row = {
-                    "timestamp": message.get("timestamp", datetime.datetime.utcnow().isoformat()),
-                    "point_id": point_id,
-                    "value": message["power"],
-                    "quality": "good"
-                }
-                self.tables["sensor_data"].log_data(data_row)
-        else:
-            # Not a topic we care about
+        # Batched topics ("iaq/batch", "powermeter/batch") carry {"readings": [...]}
+        if device_num == "batch":
+            id_key = "sensor_id" if data_type == "iaq" else "meter_id"
+            for reading in message.get("readings", []):
+                if isinstance(reading, dict) and id_key in reading:
+                    self._log_sensor_reading(data_type, reading[id_key], reading)
             return
-        
-    # def _handle_message_data(self, peer, sender, bus, topic, headers, message):
-    #     """
-    #     Callback triggered by the subscription setup using the topic from the agent's config file
-    #     """
-    #     schema = topic.split("/")[0]
-
-    #     if isinstance(message, str):
-    #         message = json.loads(message)
-
-    #     if schema in self.subscribed_topics:
-    #         for table_name, table_topics in DEFAULT_SUBSCRIPTION_TOPICS.items():
-    #             if schema in table_topics:
-    #                 t = self.tables.get(table_name, None)
-    #                 if t is None:
-    #                     _log.debug(
-    #                         f"Table {table_name} hasn't been initialized for data logging"
-    #                     )
-    #                     self.custom_health.update_health(
-    #                         status="WARNING",
-    #                         context=f"Table {table_name} hasn't been initialized for data logging",
-    #                     )
-    #                     continue
-    #                 else:
-    #                     t.log_data(message)
+
+        if device_num is not None:
+            self._log_sensor_reading(data_type, device_num, message)
+
+    def _log_sensor_reading(self, data_type, device_num, message):
+        """
+        Map a single IAQ or powermeter reading to BRICK point_ids and log it into sensor_data.
+        """
+        # Map to point_ids, iaq expects co2, temperature, humidity and powermeter expects power
+        readings = [
+            (point_id, quantize_sensor_value(message[point_type]))
+            for point_type, point_id in sensor_point_ids(data_type, device_num)
+            if point_type in message
+        ]
+        if not readings:
+            # No known field in the reading
+            return
+
+        # The fallback timestamp is only built when the reading has none
+        timestamp = message["timestamp"] if "timestamp" in message else _utcnow().isoformat()
+        self.tables["sensor_data"].log_sensor_rows(timestamp, readings)
 
     @RPC.export
-    def get_data_from_timescaledb(self, table_name: str, filters: dict):
+    def get_data_from_timescaledb(
+        self, table_name: str, filters: dict, limit: int = None, order_by: list = None
+    ):
         """
         RPC Method for querying data from TimescaleDB
 
@@ -800,6 +1369,10 @@ class Timescaledb(Agent):
 
         Supported operators: "=", "!=", ">", "<", ">=", "<=", "IN", "NOT IN", "LIKE", "NOT LIKE"
 
+            limit (int): Optional maximum number of rows to return
+            order_by (list): Optional [<column_name>, "ASC" | "DESC"] to sort the rows by, e.g.
+                ["timestamp", "DESC"] with limit=N returns the last N rows
+
         Returns:
             data (list): List of dictionaries containing the data queried from TimescaleDB
 
@@ -813,62 +1386,37 @@ class Timescaledb(Agent):
                     'value': '1289.8812590049934'}, ....]
 
         """
-        connection_string = f"dbname={self.db_name} user={self.db_user} password={self.db_password} host={self.db_host} port={self.db_port}"
-        
-        query = sql.SQL("SELECT * FROM {} WHERE ").format(sql.Identifier(table_name))
-        conditions = []
-
-        for col_name, f in filters.items():
-            for oper, value in f.items():
-                if value is None:
-                    _log.debug(
-                        f"Invalid value for column [{col_name}] -- value = {value}"
-                    )
-                    continue
-
-                if oper in [">", "<", ">=", "<=", "=", "!=", "LIKE", "NOT LIKE"]:
-                    conditions.append(
-                        sql.SQL("{} {} {}").format(
-                            sql.Identifier(col_name), sql.SQL(oper), sql.Literal(value)
-                        )
-                    )
-                elif oper.upper() in ["IN", "NOT IN"] and isinstance(value, list):
-                    conditions.append(
-                        sql.SQL("{} {} {}").format(
-                            sql.Identifier(col_name),
-                            sql.SQL(oper.upper()),
-                            sql.SQL("({})").format(
-                                sql.SQL(", ").join(map(sql.Literal, value))
-                            ),
-                        )
-                    )
-                else:
-                    _log.warning(
-                        f"Invalid filter specified for querying data from TimescaleDB -- {col_name}: {f}"
+        try:
+            with self.rpc_connection() as conn:
+                with conn.cursor() as cursor:
+                    column_types = fetch_table_column_types(cursor, self.db_name, table_name)
+                query = sql.SQL("SELECT * FROM {}").format(sql.Identifier(table_name))
+                conditions, params = build_filter_conditions(filters, "querying", column_types)
+                # Without any valid filter the whole table is read
+                if conditions:
+                    query += sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions)
+
+                # Sorting and limiting happen in the database, so only the requested rows are sent back
+                if order_by:
+                    order_col, direction = order_by
+                    direction = direction.upper()
+                    if direction not in ("ASC", "DESC"):
+                        _log.warning(f"Invalid order_by direction {direction}, using ASC")
+                        direction = "ASC"
+                    query += sql.SQL(" ORDER BY {} {}").format(
+                        sql.Identifier(order_col), sql.SQL(direction)
                     )
+                if limit is not None:
+                    params.append(int(limit))
+                    query += sql.SQL(f" LIMIT ${len(params)}")
 
-        query += sql.SQL(" AND ").join(conditions)
+                # Dates and times already arrive as ISO strings (see RPCConnection)
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    query = query.as_string(conn)
+                    _log.debug(f"[RPC] Querying data from TimescaleDB: {query} {params}")
+                    execute_prepared(cursor, query, params)
+                    data = cursor.fetchall()
 
-        try:
-            with psycopg2.connect(connection_string) as conn:
-                with conn.cursor() as cursor:
-                    _log.debug(f"[RPC] Querying data from TimescaleDB: {query.as_string(conn)}")
-                    cursor.execute(query)
-                    columns = [desc[0] for desc in cursor.description]
-                    raw_data = [dict(zip(columns, row)) for row in cursor.fetchall()]
-                    
-                    # Convert datetime objects to ISO strings for JSON serialization
-                    data = []
-                    for row in raw_data:
-                        converted_row = {}
-                        for key, value in row.items():
-                            if isinstance(value, (pendulum.DateTime, pendulum.Date)) or hasattr(value, 'isoformat'):
-                                # Convert datetime objects to ISO string
-                                converted_row[key] = value.isoformat() if hasattr(value, 'isoformat') else str(value)
-                            else:
-                                converted_row[key] = value
-                        data.append(converted_row)
-                    
                     _log.debug(f"[RPC] Finished querying data from TimescaleDB from table: {table_name}. Returned {len(data)} rows")
                     self.custom_health.update_health(
                         status="GOOD",
@@ -877,6 +1425,8 @@ class Timescaledb(Agent):
                     return data
         except Exception as e:
             _log.error(f"Error querying data from TimescaleDB table {table_name}: {e}")
+            # The table may have been altered, read its column types again on the next call
+            _table_column_types_cache.pop((self.db_name, table_name), None)
             self.custom_health.update_health(
                 status="BAD", context=f"[RPC] Error querying data from {table_name}: {e}"
             )
@@ -904,59 +1454,71 @@ class Timescaledb(Agent):
         Supported operators: "=", "!=", ">", "<", ">=", "<=", "IN", "NOT IN", "LIKE", "NOT LIKE"
 
         """
-        connection_string = f"dbname={self.db_name} user={self.db_user} password={self.db_password} host={self.db_host} port={self.db_port}"
-        
-        query = sql.SQL("DELETE FROM {} WHERE ").format(sql.Identifier(table_name))
-        conditions = []
-
-        for col_name, f in filters.items():
-            for oper, value in f.items():
-                if value is None:
-                    _log.debug(
-                        f"Invalid value for column [{col_name}] -- value = {value}"
+        try:
+            with self.rpc_connection() as conn:
+                with conn.cursor() as cursor:
+                    self._delete_rows(cursor, table_name, filters)
+                    conn.commit()
+                    _log.debug(f"Successfully deleted data from TimescaleDB table {table_name}")
+                    self.custom_health.update_health(
+                        status="GOOD",
+                        context=f"[RPC] Data deleted successfully from {table_name}",
                     )
-                    continue
+        except Exception as e:
+            _log.error(f"Error deleting data from TimescaleDB table {table_name}: {e}")
+            _table_column_types_cache.pop((self.db_name, table_name), None)
+            self.custom_health.update_health(
+                status="BAD", context=f"[RPC] Error deleting data from {table_name}: {e}"
+            )
 
-                if oper in [">", "<", ">=", "<=", "=", "!=", "LIKE", "NOT LIKE"]:
-                    conditions.append(
-                        sql.SQL("{} {} {}").format(
-                            sql.Identifier(col_name), sql.SQL(oper), sql.Literal(value)
-                        )
-                    )
-                elif oper.upper() in ["IN", "NOT IN"] and isinstance(value, list):
-                    conditions.append(
-                        sql.SQL("{} {} {}").format(
-                            sql.Identifier(col_name),
-                            sql.SQL(oper.upper()),
-                            sql.SQL("({})").format(
-                                sql.SQL(", ").join(map(sql.Literal, value))
-                            ),
-                        )
-                    )
-                else:
-                    _log.warning(
-                        f"Invalid filter specified for deleting data from TimescaleDB -- {col_name}: {f}"
-                    )
+    @RPC.export
+    def bulk_drop_data_from_timescaledb(self, table_name: str, filters_list: list):
+        """
+        RPC Method for deleting data from TimescaleDB in the specified table with several filters,
+        in a single transaction (one commit) instead of one drop_data_from_timescaledb call each
 
-        query += sql.SQL(" AND ").join(conditions)
+        Args:
+            table_name (str): Name of the table to delete data from
+            filters_list (list): List of filters, see drop_data_from_timescaledb for their format
 
+        """
         try:
-            with psycopg2.connect(connection_string) as conn:
+            with self.rpc_connection() as conn:
                 with conn.cursor() as cursor:
-                    _log.debug(f"[RPC] Deleting data from TimescaleDB: {query.as_string(conn)}")
-                    cursor.execute(query)
+                    for filters in filters_list:
+                        self._delete_rows(cursor, table_name, filters)
                     conn.commit()
-                    _log.debug(f"Successfully deleted data from TimescaleDB table {table_name}")
+                    _log.debug(
+                        f"Successfully deleted data from TimescaleDB table {table_name} with {len(filters_list)} filters"
+                    )
                     self.custom_health.update_health(
                         status="GOOD",
                         context=f"[RPC] Data deleted successfully from {table_name}",
                     )
         except Exception as e:
             _log.error(f"Error deleting data from TimescaleDB table {table_name}: {e}")
+            _table_column_types_cache.pop((self.db_name, table_name), None)
             self.custom_health.update_health(
                 status="BAD", context=f"[RPC] Error deleting data from {table_name}: {e}"
             )
 
+    def _delete_rows(self, cursor, table_name: str, filters: dict):
+        """
+        Delete the rows of table_name matching filters (see self.drop_data_from_timescaledb)
+        on the given cursor. The caller commits.
+        """
+        column_types = fetch_table_column_types(cursor, self.db_name, table_name)
+        conditions, params = build_filter_conditions(filters, "deleting", column_types)
+        if not conditions:
+            # Not deleting the whole table because all filters were empty or invalid
+            raise ValueError(f"No valid filter to delete data from {table_name}")
+        query = sql.SQL("DELETE FROM {} WHERE ").format(sql.Identifier(table_name))
+        query += sql.SQL(" AND ").join(conditions)
+
+        query = query.as_string(cursor.connection)
+        _log.debug(f"[RPC] Deleting data from TimescaleDB: {query} {params}")
+        execute_prepared(cursor, query, params)
+
     @RPC.export
     def insert_data_to_timescaledb(self, table_name: str, data: list):
         """
@@ -977,29 +1539,11 @@ class Timescaledb(Agent):
 
         """
         _log.debug(f"[RPC] Inserting data to TimescaleDB: {data}")
-        connection_string = f"dbname={self.db_name} user={self.db_user} password={self.db_password} host={self.db_host} port={self.db_port}"
-
         try:
-            with psycopg2.connect(connection_string) as conn:
+            with self.rpc_connection() as conn:
                 with conn.cursor() as cursor:
-                    # Get table column names dynamically
-                    cursor.execute(f"SELECT column_name FROM information_schema.columns WHERE table_name = '{table_name}' ORDER BY ordinal_position;")
-                    table_column_names = [row[0] for row in cursor.fetchall()]
-                    
-                    if not table_column_names:
-                        _log.error(f"Table {table_name} not found or has no columns")
+                    if not self._insert_rows(cursor, table_name, data):
                         return "Error"
-
-                    # Prepare the data for insertion
-                    values = [[row.get(col, None) for col in table_column_names] for row in data]
-
-                    query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
-                        sql.Identifier(table_name),
-                        sql.SQL(", ").join(map(sql.Identifier, table_column_names)),
-                    )
-
-                    _log.debug(f"[RPC] Inserting data to TimescaleDB: {query.as_string(conn)}")
-                    execute_values(cursor, query, values)
                     conn.commit()
                     _log.debug(f"Successfully inserted data to TimescaleDB table {table_name}")
                     self.custom_health.update_health(
@@ -1009,42 +1553,155 @@ class Timescaledb(Agent):
                     return "Success"
         except Exception as e:
             _log.error(f"Error inserting data to TimescaleDB table {table_name}: {e}")
+            # The table may have been altered, read its columns again on the next call
+            self._insert_queries.pop(table_name, None)
+            _table_columns_cache.pop((self.db_name, table_name), None)
+            _table_column_types_cache.pop((self.db_name, table_name), None)
             self.custom_health.update_health(
                 status="BAD", context=f"[RPC] Error inserting data to {table_name}: {e}"
             )
             return "Error"
 
+    def _insert_rows(self, cursor, table_name: str, data: list):
+        """
+        Insert the dicts of data into table_name (see self.insert_data_to_timescaledb) on the
+        given cursor. The caller commits. Return False if the table doesn't exist.
+        """
+        conn = cursor.connection
+        # Column names, INSERT prefix and row template are built once per table
+        insert = self._insert_queries.get(table_name)
+        if insert is None:
+            # Get table column names dynamically, shared with the table handlers
+            table_column_names = fetch_table_columns(cursor, self.db_name, table_name)
+
+            if not table_column_names:
+                _log.error(f"Table {table_name} not found or has no columns")
+                return False
+
+            query = sql.SQL("INSERT INTO {} ({}) VALUES ").format(
+                sql.Identifier(table_name),
+                sql.SQL(", ").join(map(sql.Identifier, table_column_names)),
+            )
+            template = "(" + ", ".join(["%s"] * len(table_column_names)) + ")"
+            # Values of json/jsonb columns are sent by the INSERT as JSON, as CSV COPY does
+            # (see copy_csv_value)
+            column_types = fetch_table_column_types(cursor, self.db_name, table_name)
+            json_columns = tuple(
+                idx
+                for idx, column in enumerate(table_column_names)
+                if column_types.get(column) in ("json", "jsonb")
+            )
+            copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH " + CSV_COPY_OPTIONS).format(
+                sql.Identifier(table_name),
+                sql.SQL(", ").join(map(sql.Identifier, table_column_names)),
+            )
+            insert = (
+                table_column_names,
+                query.as_bytes(conn),
+                template,
+                copy_query.as_string(conn),
+                json_columns,
+            )
+            self._insert_queries[table_name] = insert
+        table_column_names, query, template, copy_query, json_columns = insert
+
+        if not data:
+            return True
+
+        _log.debug(f"[RPC] Inserting {len(data)} rows to TimescaleDB table {table_name}")
+        rows = table_rows(data, table_column_names)
+        if len(data) >= RPC_COPY_MIN_ROWS:
+            # Rows sorted by time land in as few hypertable chunks (and pages) at once as possible
+            if "timestamp" in table_column_names:
+                try:
+                    rows.sort(key=itemgetter(table_column_names.index("timestamp")))
+                except TypeError:
+                    # Mixed or missing timestamps, left in the order received
+                    pass
+            # Large batches are streamed as CSV like the flush thread does, storing the same
+            # values as the INSERT below (see csv_copy_buffer)
+            cursor.copy_expert(copy_query, csv_copy_buffer(rows))
+        else:
+            if json_columns:
+                rows = [json_row(row, json_columns) for row in rows]
+            # Bind every row with mogrify (in C) and send a single multi-row INSERT
+            values = b",".join(cursor.mogrify(template, row) for row in rows)
+            cursor.execute(query + values)
+        return True
+
+    @RPC.export
+    def bulk_ops_timescaledb(self, ops: list):
+        """
+        RPC Method for running several inserts and deletes in a single transaction, on one
+        connection. Either all operations are applied or none.
+
+        Args:
+            ops (list): List of operations, applied in order, with the following format:
+
+            ops = [
+                {"op": "insert", "table_name": <table_name>, "data": <data>},
+                {"op": "drop", "table_name": <table_name>, "filters": <filters>},
+                ...
+            ]
+
+            See insert_data_to_timescaledb and drop_data_from_timescaledb for data and filters.
+
+        Returns:
+            "Success" or "Error"
+
+        """
+        _log.debug(f"[RPC] Running {len(ops)} operations on TimescaleDB")
+        try:
+            with self.rpc_connection() as conn:
+                with conn.cursor() as cursor:
+                    for op in ops:
+                        table_name = op["table_name"]
+                        if op["op"] == "insert":
+                            if not self._insert_rows(cursor, table_name, op.get("data", [])):
+                                conn.rollback()
+                                return "Error"
+                        elif op["op"] == "drop":
+                            self._delete_rows(cursor, table_name, op.get("filters", {}))
+                        else:
+                            raise ValueError(f"Unknown operation {op['op']}")
+                    conn.commit()
+                    self.custom_health.update_health(
+                        status="GOOD",
+                        context=f"[RPC] {len(ops)} operations applied successfully",
+                    )
+                    return "Success"
+        except Exception as e:
+            _log.error(f"Error running operations on TimescaleDB: {e}")
+            # Tables may have been altered, read their columns again on the next call
+            self._insert_queries.clear()
+            _table_columns_cache.clear()
+            _table_column_types_cache.clear()
+            self.custom_health.update_health(
+                status="BAD", context=f"[RPC] Error running operations on TimescaleDB: {e}"
+            )
+            return "Error"
+
     @RPC.export("query_data_from_timescaledb")
     def query_data_from_timescaledb(
         self,
         query: str,
     ):
-        connection_string = f"dbname={self.db_name} user={self.db_user} password={self.db_password} host={self.db_host} port={self.db_port}"
         try:
-            with psycopg2.connect(connection_string) as conn:
+            with self.rpc_connection() as conn:
                 _log.info(f"Connected to TimescaleDB database: {self.db_name} at {self.db_host}:{self.db_port}")
                 self.custom_health.update_health(
                     status="GOOD",
                     context="[RPC] Connected to TimescaleDB"
                 )
-                with conn.cursor() as cursor:
+                # SELECT results are streamed from a server-side cursor, so that the whole result
+                # set isn't held by libpq and as Python rows at the same time
+                name = f"rpc_query_{uuid.uuid4().hex}" if SELECT_QUERY_RE.match(query) else None
+                # Dates and times already arrive as ISO strings (see RPCConnection)
+                with conn.cursor(name=name, cursor_factory=RealDictCursor) as cursor:
+                    if name is not None:
+                        cursor.itersize = RPC_QUERY_ITERSIZE
                     cursor.execute(query)
-                    columns = [desc[0] for desc in cursor.description]
-                    raw_data = [dict(zip(columns, row)) for row in cursor.fetchall()]
-                    
-                    # Convert datetime objects to ISO strings for JSON serialization
-                    data = []
-                    for row in raw_data:
-                        converted_row = {}
-                        for key, value in row.items():
-                            if isinstance(value, (pendulum.DateTime, pendulum.Date)) or hasattr(value, 'isoformat'):
-                                # Convert datetime objects to ISO string
-                                converted_row[key] = value.isoformat() if hasattr(value, 'isoformat') else str(value)
-                            else:
-                                converted_row[key] = value
-                        data.append(converted_row)
-                    
-                    return data
+                    return list(cursor) if name is not None else cursor.fetchall()
         except Exception as e:
             _log.error(f"Error querying data from TimescaleDB: {e}")
             self.custom_health.update_health(
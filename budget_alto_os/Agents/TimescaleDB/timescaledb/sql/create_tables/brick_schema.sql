@@ -27,6 +27,42 @@ CREATE TABLE IF NOT EXISTS brick_points (
     max_value FLOAT
 );
 
+-- Zone of each measurement point, flattened from the points -> entities ->
+-- hasLocation relationships graph so that zone lookups skip the joins
+CREATE MATERIALIZED VIEW IF NOT EXISTS point_zone_mapping AS
+SELECT bp.point_id, br.object_id AS zone_id, bp.point_type
+FROM brick_points bp
+JOIN brick_entities be ON bp.device_id = be.entity_id
+JOIN brick_relationships br ON be.entity_id = br.subject_id
+WHERE br.predicate = 'brick:hasLocation';
+
+CREATE INDEX IF NOT EXISTS point_zone_mapping_zone_id_point_type_idx
+    ON point_zone_mapping (zone_id, point_type);
+
+-- The BRICK graph rarely changes, so the mapping is rebuilt on every write to it
+CREATE OR REPLACE FUNCTION refresh_point_zone_mapping()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW point_zone_mapping;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS brick_points_refresh_point_zone_mapping ON brick_points;
+CREATE TRIGGER brick_points_refresh_point_zone_mapping
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON brick_points
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_point_zone_mapping();
+
+DROP TRIGGER IF EXISTS brick_entities_refresh_point_zone_mapping ON brick_entities;
+CREATE TRIGGER brick_entities_refresh_point_zone_mapping
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON brick_entities
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_point_zone_mapping();
+
+DROP TRIGGER IF EXISTS brick_relationships_refresh_point_zone_mapping ON brick_relationships;
+CREATE TRIGGER brick_relationships_refresh_point_zone_mapping
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON brick_relationships
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_point_zone_mapping();
+
 -- Time-series data (all sensor/meter readings)
 CREATE TABLE IF NOT EXISTS sensor_data (
     timestamp TIMESTAMPTZ NOT NULL,
@@ -44,6 +80,86 @@ SELECT create_hypertable(
     if_not_exists => TRUE
 );
 
+-- Index for "latest value per point" lookups
+CREATE INDEX IF NOT EXISTS sensor_data_point_id_timestamp_idx
+    ON sensor_data (point_id, timestamp DESC);
+
+-- Latest value per point, so that current readings are a primary key lookup
+-- however much history sensor_data holds. Continuous aggregates need a
+-- time_bucket, so this is a plain materialized view refreshed by a job.
+-- Only the last day is read, so each refresh stays on the recent, uncompressed
+-- chunks. A point silent for longer than that has no current reading.
+-- Drop the unbounded definition of earlier versions so it is recreated below.
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_matviews
+        WHERE matviewname = 'latest_point_value'
+          AND schemaname = current_schema()
+          AND definition NOT LIKE '%now()%'
+    ) THEN
+        DROP MATERIALIZED VIEW latest_point_value;
+    END IF;
+END
+$$;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS latest_point_value AS
+SELECT DISTINCT ON (point_id) point_id, value, timestamp
+FROM sensor_data
+WHERE timestamp > now() - INTERVAL '1 day'
+ORDER BY point_id, timestamp DESC;
+
+CREATE UNIQUE INDEX IF NOT EXISTS latest_point_value_point_id_idx
+    ON latest_point_value (point_id);
+
+CREATE OR REPLACE PROCEDURE refresh_latest_point_value(job_id INT, config JSONB)
+LANGUAGE plpgsql AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY latest_point_value;
+END
+$$;
+
+-- Refresh every 15 seconds, in line with the simulator publish rate
+SELECT add_job('refresh_latest_point_value', INTERVAL '15 seconds')
+WHERE NOT EXISTS (
+    SELECT 1 FROM timescaledb_information.jobs
+    WHERE proc_name = 'refresh_latest_point_value'
+);
+
+-- Compress chunks older than a day into per-point columnar segments, so that
+-- historical reads only touch the points they ask for
+ALTER TABLE sensor_data SET (
+    timescaledb.compress,
+    timescaledb.compress_segmentby = 'point_id',
+    timescaledb.compress_orderby = 'timestamp DESC'
+);
+
+SELECT add_compression_policy(
+    'sensor_data',
+    INTERVAL '1 day',
+    if_not_exists => TRUE
+);
+
+-- Hourly energy rollup per point, so that consumption over a period sums a
+-- few rows per hour instead of every raw reading
+CREATE MATERIALIZED VIEW IF NOT EXISTS hourly_kwh
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT
+    time_bucket('1 hour', timestamp) AS bucket,
+    point_id,
+    SUM(value) AS total_kwh
+FROM sensor_data
+GROUP BY bucket, point_id
+WITH NO DATA;
+
+SELECT add_continuous_aggregate_policy(
+    'hourly_kwh',
+    start_offset => INTERVAL '3 days',
+    end_offset => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '1 hour',
+    if_not_exists => TRUE
+);
+
 -- Add retention policy (customize interval as needed)
 SELECT add_retention_policy(
     'sensor_data',
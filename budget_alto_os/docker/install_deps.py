@@ -6,25 +6,31 @@ sys.path.append('/startup')
 def _install_addl_deps():
     from requirements import extras_require as extras
 
+    # All groups are installed by a single pip run, which starts and resolves only once
     addl_deps = ["web", "testing", "weather", "drivers", "databases"]
+    install_cmd = ["pip3", "install"]
     for dep in addl_deps:
         deps_to_install = extras.get(dep, None)
         if deps_to_install is not None:
-            install_cmd = ["pip3", "install"]
-            install_cmd.extend(deps_to_install)
             print(f"Installing {dep} group dependencies: {deps_to_install}")
-            subprocess.check_call(install_cmd)
+            install_cmd.extend(deps_to_install)
+    if len(install_cmd) > 2:
+        subprocess.check_call(install_cmd)
 
 def _install_required_deps():
     from requirements import option_requirements as opt_reqs
 
+    # One pip run per distinct set of options, packages sharing the same options are installed together
+    packages_by_options = {}
     for req in opt_reqs:
         package, options = req
+        packages_by_options.setdefault(tuple(options or ()), []).append(package)
+
+    for options, packages in packages_by_options.items():
         install_cmd = ["pip3", "install", "--no-deps"]
-        if options:
-            for opt in options:
-                install_cmd.extend([f'--config-settings="{opt}"'])
-        install_cmd.append(package)
+        for opt in options:
+            install_cmd.extend([f'--config-settings="{opt}"'])
+        install_cmd.extend(packages)
         subprocess.check_call(install_cmd)
 
 
@@ -3,6 +3,7 @@ import sys
 import yaml
 from slogger import get_logger
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 slogger = get_logger("reinstall-agents", "reinstall-agents")
 
@@ -12,6 +13,10 @@ VOLTTRON_ROOT = os.environ["VOLTTRON_ROOT"]
 KEYSTORES = os.path.join(VOLTTRON_HOME, "keystores")
 INSTALL_PATH = "{}/scripts/install-agent.py".format(VOLTTRON_ROOT)
 VOLTTRON_CTL_CMD = "volttron-ctl"
+# Number of agents installed at the same time. Installs run one after the other unless
+# MAX_PARALLEL_INSTALLS is set higher: concurrent install-agent.py runs share the config
+# store and their output interleaves.
+MAX_PARALLEL_INSTALLS = max(1, int(os.environ.get("MAX_PARALLEL_INSTALLS") or 1))
 
 def get_platform_configurations(platform_config_path):
     with open(platform_config_path) as cin:
@@ -40,6 +45,112 @@ def get_platform_config_path():
 
     return platform_config
 
+def _install_one(identity, spec, envcpy):
+    """
+    Install the agent of one identity and load its config_store entries.
+    Return the identity if its install command failed, None otherwise.
+    """
+    slogger.info("Processing identity: {}".format(identity))
+    sys.stdout.write("Processing identity: {}\n".format(identity))
+    if "source" not in spec:
+        slogger.info(f"Invalid source for identity: {identity}")
+        sys.stderr.write("Invalid source for identity: {}\n".format(identity))
+        return None
+
+    # get the source code of the agent
+    agent_source = os.path.expandvars(os.path.expanduser(spec["source"]))
+    if not os.path.exists(agent_source):
+        slogger.info(
+            f"Invalid agent source {agent_source} for identity {identity}"
+        )
+        sys.stderr.write(
+            "Invalid agent source ({}) for agent id identity: {}\n".format(
+                agent_source, identity
+            )
+        )
+        return None
+
+    # get agent configuration
+    agent_cfg = None
+    if "config" in spec and spec["config"]:
+        agent_cfg = os.path.abspath(
+            os.path.expandvars(os.path.expanduser(spec["config"]))
+        )
+        if not os.path.exists(agent_cfg):
+            slogger.info(f"Invalid config {agent_cfg} for identity {identity}")
+            sys.stderr.write(
+                "Invalid config ({}) for agent id identity: {}\n".format(
+                    agent_cfg, identity
+                )
+            )
+            return None
+
+    # grab the priority from the system config file
+    # priority = spec.get("priority", "50")
+    tag = spec.get("tag", "all_agents")
+
+    install_cmd = ["python3", INSTALL_PATH]
+    install_cmd.extend(["--agent-source", agent_source])
+    install_cmd.extend(["--vip-identity", identity])
+    # install_cmd.extend(["--priority", priority])
+    # install_cmd.extend(["--agent-start-time", AGENT_START_TIME])
+    install_cmd.append("--force")
+    install_cmd.extend(["--tag", tag])
+
+    if agent_cfg:
+        print(f"Using agent config: {agent_cfg}")
+        install_cmd.extend(["--config", agent_cfg])
+
+    try:
+        subprocess.check_call(install_cmd, env=envcpy)
+    except subprocess.CalledProcessError as e:
+        # sometimes, the install command returns an Error saying that volttron couldn't install the agent, when in fact the agent was successfully installed
+        # this is most likely a bug in Volttron. For now, we are ignoring that error so that the setup of the Volttron platform does not fail and to allow Docker to start the container
+        sys.stderr.write(f"IGNORING ERROR: {e}")
+        slogger.debug(f"IGNORING ERROR: {e}")
+        return identity
+
+    if "config_store" in spec:
+        sys.stdout.write("Processing config_store entries")
+        for key, entry in spec["config_store"].items():
+            if "file" not in entry or not entry["file"]:
+                slogger.info(
+                    f"Invalid config store entry; file must be specified for {key}"
+                )
+                sys.stderr.write(
+                    "Invalid config store entry file must be specified for {}".format(
+                        key
+                    )
+                )
+                continue
+            entry_file = os.path.expandvars(os.path.expanduser(entry["file"]))
+
+            if not os.path.exists(entry_file):
+                slogger.info(
+                    f"Invalid config store file not exist: {entry_file}"
+                )
+                sys.stderr.write(
+                    "Invalid config store file does not exist {}".format(
+                        entry_file
+                    )
+                )
+                continue
+
+            entry_cmd = [
+                VOLTTRON_CTL_CMD,
+                "config",
+                "store",
+                identity,
+                key,
+                entry_file,
+            ]
+            if "type" in entry:
+                entry_cmd.append(entry["type"])
+
+            subprocess.check_call(entry_cmd)
+    return None
+
+
 def install_agents(agents):
     need_to_install = {}
 
@@ -55,110 +166,29 @@ def install_agents(agents):
     # if we need to do installs then we haven't setup this at all.
     if need_to_install:
         envcpy = os.environ.copy()
+        # This allows install agent to ignore the fact that we aren't running
+        # form a virtual environment.
+        envcpy["IGNORE_ENV_CHECK"] = "1"
         failed_install = []
-        for identity, spec in need_to_install.items():
-            slogger.info("Processing identity: {}".format(identity))
-            sys.stdout.write("Processing identity: {}\n".format(identity))
-            if "source" not in spec:
-                slogger.info(f"Invalid source for identity: {identity}")
-                sys.stderr.write("Invalid source for identity: {}\n".format(identity))
-                continue
-
-            # get the source code of the agent
-            agent_source = os.path.expandvars(os.path.expanduser(spec["source"]))
-            if not os.path.exists(agent_source):
-                slogger.info(
-                    f"Invalid agent source {agent_source} for identity {identity}"
-                )
-                sys.stderr.write(
-                    "Invalid agent source ({}) for agent id identity: {}\n".format(
-                        agent_source, identity
-                    )
-                )
-                continue
-
-            # get agent configuration
-            agent_cfg = None
-            if "config" in spec and spec["config"]:
-                agent_cfg = os.path.abspath(
-                    os.path.expandvars(os.path.expanduser(spec["config"]))
-                )
-                if not os.path.exists(agent_cfg):
-                    slogger.info(f"Invalid config {agent_cfg} for identity {identity}")
-                    sys.stderr.write(
-                        "Invalid config ({}) for agent id identity: {}\n".format(
-                            agent_cfg, identity
-                        )
-                    )
-                    continue
-
-            # grab the priority from the system config file
-            # priority = spec.get("priority", "50")
-            tag = spec.get("tag", "all_agents")
-
-            install_cmd = ["python3", INSTALL_PATH]
-            install_cmd.extend(["--agent-source", agent_source])
-            install_cmd.extend(["--vip-identity", identity])
-            # install_cmd.extend(["--priority", priority])
-            # install_cmd.extend(["--agent-start-time", AGENT_START_TIME])
-            install_cmd.append("--force")
-            install_cmd.extend(["--tag", tag])
-
-            if agent_cfg:
-                print(f"Using agent config: {agent_cfg}")
-                install_cmd.extend(["--config", agent_cfg])
-
-            # This allows install agent to ignore the fact that we aren't running
-            # form a virtual environment.
-            envcpy["IGNORE_ENV_CHECK"] = "1"
-            try:
-                subprocess.check_call(install_cmd, env=envcpy)
-            except subprocess.CalledProcessError as e:
-                # sometimes, the install command returns an Error saying that volttron couldn't install the agent, when in fact the agent was successfully installed
-                # this is most likely a bug in Volttron. For now, we are ignoring that error so that the setup of the Volttron platform does not fail and to allow Docker to start the container
-                sys.stderr.write(f"IGNORING ERROR: {e}")
-                slogger.debug(f"IGNORING ERROR: {e}")
-                failed_install.append(identity)
-                continue
-
-            if "config_store" in spec:
-                sys.stdout.write("Processing config_store entries")
-                for key, entry in spec["config_store"].items():
-                    if "file" not in entry or not entry["file"]:
-                        slogger.info(
-                            f"Invalid config store entry; file must be specified for {key}"
-                        )
-                        sys.stderr.write(
-                            "Invalid config store entry file must be specified for {}".format(
-                                key
-                            )
-                        )
-                        continue
-                    entry_file = os.path.expandvars(os.path.expanduser(entry["file"]))
-
-                    if not os.path.exists(entry_file):
-                        slogger.info(
-                            f"Invalid config store file not exist: {entry_file}"
-                        )
-                        sys.stderr.write(
-                            "Invalid config store file does not exist {}".format(
-                                entry_file
-                            )
-                        )
-                        continue
-
-                    entry_cmd = [
-                        VOLTTRON_CTL_CMD,
-                        "config",
-                        "store",
-                        identity,
-                        key,
-                        entry_file,
-                    ]
-                    if "type" in entry:
-                        entry_cmd.append(entry["type"])
-
-                    subprocess.check_call(entry_cmd)
+        max_workers = min(MAX_PARALLEL_INSTALLS, len(need_to_install))
+        if max_workers > 1:
+            # Opt-in: each install is an install-agent.py process, the workers only wait on
+            # their subprocess, threads are enough.
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(
+                    _install_one,
+                    need_to_install.keys(),
+                    need_to_install.values(),
+                    [envcpy] * len(need_to_install),
+                ))
+        else:
+            results = [
+                _install_one(identity, spec, envcpy)
+                for identity, spec in need_to_install.items()
+            ]
+        for failed in results:
+            if failed is not None:
+                failed_install.append(failed)
         slogger.info(f"Agents that failed to install {failed_install}")
 
 
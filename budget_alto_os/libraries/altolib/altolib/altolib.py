@@ -8,19 +8,30 @@
 #
 
 import logging
-import irgen
 import datetime as dt
 import time
-import paho.mqtt.client as mqtt
 from typing import Any, List, Mapping, Union, Optional, Dict
 from volttron.platform.vip.agent import Agent, Core
 from volttron.platform.scheduling import periodic
 import json
 from queue import Empty, Queue, Full
 
-import pendulum
+try:
+    import orjson
+
+    def json_dumps(obj: Any) -> str:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            # What orjson can't serialise (e.g. integers beyond 64 bits, tuple keys)
+            return json.dumps(obj)
+
+except ImportError:  # orjson is optional, fall back on the standard library
+    json_dumps = json.dumps
+
 import gevent
 from enum import Enum
+from functools import lru_cache
 from threading import RLock
 
 # Logging setup will have to be done by the actual agent
@@ -31,6 +42,36 @@ _log = logging.getLogger(__name__)
 TIMERESOLUTION = 2
 RIDSEP = "_^_"
 
+#: Second and formatted date/time of the last timestamp built by utc_isoformat
+_last_timestamp = (None, "")
+
+
+def utc_isoformat() -> str:
+    """
+    Current UTC time as an ISO 8601 string with microseconds, e.g. 2024-01-01T00:00:00.123456+00:00.
+    The date and time up to the second only get formatted once per second.
+
+    """
+    global _last_timestamp
+    now = time.time()
+    second = int(now)
+    last_second, prefix = _last_timestamp
+    if second != last_second:
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        _last_timestamp = (second, prefix)
+    return f"{prefix}.{int((now - second) * 1000000):06d}+00:00"
+
+
+def local_isoformat(timezone: str) -> str:
+    """
+    Current time in the given timezone as an ISO 8601 string, as used in the health payloads.
+
+    """
+    # Only the health reporting needs pendulum, it is not imported with the library
+    import pendulum
+
+    return pendulum.now(timezone).to_iso8601_string()
+
 
 class AltoNotImpl(Exception):
     """
@@ -87,12 +128,20 @@ class AltoDevice(object):
         self.controller = controller
         self.device_id = devid
         self.number_subdevices = nbsubdev
-        self.name_subdevices = [f"subdev_{i}" for i in range(0, nbsubdev)]
-        self.current_state = {}
-        for idx in range(nbsubdev):
-            self.current_state[idx] = {}
+        if nbsubdev == 1:
+            # Most devices (a single plug, a single probe) have only one subdevice
+            self.name_subdevices = ["subdev_0"]
+            #: Index of each subdevice name, kept in sync by set_subdevice_name
+            self._name_to_idx = {"subdev_0": 0}
+            self.current_state = {0: {}}
+        else:
+            self.name_subdevices = [f"subdev_{i}" for i in range(0, nbsubdev)]
+            self._name_to_idx = {name: i for i, name in enumerate(self.name_subdevices)}
+            self.current_state = {idx: {} for idx in range(nbsubdev)}
         self.info = {}
         self.is_online = False
+        #: Topic of the online_status events, built on first use once the controller is configured
+        self._online_topic = None
 
     def set_subdevice_name(self, subdevice_idx: int, name: str) -> bool:
         """
@@ -109,7 +158,9 @@ class AltoDevice(object):
         """
         if subdevice_idx in range(self.number_subdevices):
             if name not in self.name_subdevices:
+                self._name_to_idx.pop(self.name_subdevices[subdevice_idx], None)
                 self.name_subdevices[subdevice_idx] = name
+                self._name_to_idx[name] = subdevice_idx
             elif self.name_subdevices.index(name) != subdevice_idx:
                 _log.error(
                     f"Subdevice name must be unique. Subdevice {subdevice_idx} cannot be named {name} has it is already used for subdevice {self.name_subdevices.index(name)}"
@@ -133,16 +184,17 @@ class AltoDevice(object):
         :rtype: int
 
         """
-        try:
-            if isinstance(name, str):
-                return self.name_subdevices.index(name)
-            else:
-                return name  # must be int then, since we use type hints
-        except Exception as e:
-            _log.error(
-                f"Could not find name {name} in {self.name_subdevices}. Exception error : {e}"
-            )
-            return 0
+        if not isinstance(name, str):
+            return name  # must be int then, since we use type hints
+        idx = self._name_to_idx.get(name)
+        if idx is None:
+            # Subclasses may set name_subdevices directly, rebuild the lookup from it
+            self._name_to_idx = {n: i for i, n in enumerate(self.name_subdevices)}
+            idx = self._name_to_idx.get(name)
+            if idx is None:
+                _log.error(f"Could not find name {name} in {self.name_subdevices}.")
+                return 0
+        return idx
 
     def update_device(self, device):
         """
@@ -173,21 +225,22 @@ class AltoDevice(object):
         Returns the schemas supported by this device
 
         """
-        return [x for x in self.current_state[0].keys()]
+        return list(self.current_state[0])
 
     def online_status(self, value: bool) -> None:
         """
         This implement the online_status schema that must be implemented by all agents.
 
         """
-        print("in online_status")
         if self.is_online == value:
             return
 
         self.is_online = value
-        topic = self.controller.topic + "online_status/" + self.controller.agent_name
-        topic += "/" + self.device_id
-        self.controller.publish(topic, {"online": value}, "event")
+        if self._online_topic is None:
+            self._online_topic = (
+                f"{self.controller.topic}online_status/{self.controller.agent_name}/{self.device_id}"
+            )
+        self.controller.publish(self._online_topic, {"online": value}, "event")
 
 
 class AltoSwitchDevice(AltoDevice):
@@ -203,10 +256,14 @@ class AltoSwitchDevice(AltoDevice):
 
     """
 
+    #: Initial "switch" state of each subdevice, copied for every one of them
+    _switch_template = {"state": None}
+
     def __init__(self, controller: Agent, devid: str, nbsubdev: int = 1) -> AltoDevice:
         super().__init__(controller, devid, nbsubdev)
+        template = self._switch_template
         for idx in range(self.number_subdevices):
-            self.current_state[idx]["switch"] = {"state": None}
+            self.current_state[idx]["switch"] = template.copy()
 
     def turn_on(self, subdev):
         """
@@ -234,15 +291,17 @@ class AltoSwitchDevice(AltoDevice):
         :type state: str
 
         """
-        subdevice_idx = self.subdevice_name_to_idx(subdevice)
-        # _log.debug(f"\n\nSwitch current state {self.current_state[subdevice_idx]}")
-        if self.current_state[subdevice_idx]["switch"]["state"] != state:
-            _log.debug(
-                f"Switch from {self.current_state[subdevice_idx]['switch']['state']} to {state}"
-            )
-            self.current_state[subdevice_idx]["switch"]["state"] = state
-            self.event_switch_state_change(subdevice_idx)
-            # _log.debug(f"Switch after state {self.current_state[subdevice_idx]}\n\n")
+        # Indexes, the common case, skip the name lookup
+        subdevice_idx = (
+            subdevice if type(subdevice) is int else self.subdevice_name_to_idx(subdevice)
+        )
+        switch = self.current_state[subdevice_idx]["switch"]
+        # Most reports repeat the current state, nothing more to do then
+        if switch["state"] == state:
+            return
+        _log.debug("Switch from %s to %s", switch["state"], state)
+        switch["state"] = state
+        self.event_switch_state_change(subdevice_idx)
 
     def event_switch_state_change(self, subdevice_idx: int) -> None:
         """
@@ -270,11 +329,7 @@ class AltoDimmerDevice(AltoSwitchDevice):
 
     """
 
-    def __init__(self, controller: Agent, devid: str, nbsubdev: int = 1) -> AltoDevice:
-        super().__init__(controller, devid, nbsubdev)
-        for idx in range(self.number_subdevices):
-            self.current_state[idx]["switch"] = {
-                "state": None, "bright_value": None}
+    _switch_template = {"state": None, "bright_value": None}
 
     def turn_on(self, subdev):
         """
@@ -298,39 +353,6 @@ class AltoDimmerDevice(AltoSwitchDevice):
         raise AltoNotImpl(
             "Switch device set_bright_value method must be implemented")
 
-    def update_switch_state(self, subdevice: Union[int, str], state: str) -> None:
-        """
-        Method to be invoked whenever a switch state information is received.
-        This method will check if a change is detected and will broadcast the
-        'relay' event if needed.
-
-        :param subdevice: The name or index of the subdevice
-        :type subevice: int or string
-        :param state: The state, "on" or "off"
-        :type state: str
-
-        """
-        subdevice_idx = self.subdevice_name_to_idx(subdevice)
-        # _log.debug(f"\n\nSwitch current state {self.current_state[subdevice_idx]}")
-        if self.current_state[subdevice_idx]["switch"]["state"] != state:
-            _log.debug(
-                f"Switch from {self.current_state[subdevice_idx]['switch']['state']} to {state}"
-            )
-            self.current_state[subdevice_idx]["switch"]["state"] = state
-            self.event_switch_state_change(subdevice_idx)
-            # _log.debug(f"Switch after state {self.current_state[subdevice_idx]}\n\n")
-
-    def event_switch_state_change(self, subdevice_idx: int) -> None:
-        """
-        Method used to signal on the Volttron bus that a relay state change has
-        been detected. In most cases, this should nopt be called directly, :func: update_switch_state
-        should be used.
-
-        """
-        self.controller.emit_event_relay(
-            self, subdevice_idx, self.current_state[subdevice_idx]["switch"]["state"]
-        )
-
     def update_bright_value(self, subdevice: Union[int, str], value: int) -> None:
         """
         Method to be invoked whenever a switch bright value information is received.
@@ -343,15 +365,17 @@ class AltoDimmerDevice(AltoSwitchDevice):
         :type state: int
 
         """
-        subdevice_idx = self.subdevice_name_to_idx(subdevice)
-        # _log.debug(f"\n\nSwitch current state {self.current_state[subdevice_idx]}")
-        if self.current_state[subdevice_idx]["switch"]["bright_value"] != value:
-            _log.debug(
-                f"Switch from {self.current_state[subdevice_idx]['switch']['bright_value']} to {value}"
-            )
-            self.current_state[subdevice_idx]["switch"]["bright_value"] = value
-            self.event_bright_value_change(subdevice_idx)
-            # _log.debug(f"Switch after state {self.current_state[subdevice_idx]}\n\n")
+        # Indexes, the common case, skip the name lookup
+        subdevice_idx = (
+            subdevice if type(subdevice) is int else self.subdevice_name_to_idx(subdevice)
+        )
+        switch = self.current_state[subdevice_idx]["switch"]
+        # Most reports repeat the current value, nothing more to do then
+        if switch["bright_value"] == value:
+            return
+        _log.debug("Switch from %s to %s", switch["bright_value"], value)
+        switch["bright_value"] = value
+        self.event_bright_value_change(subdevice_idx)
 
     def event_bright_value_change(self, subdevice_idx: int) -> None:
         """
@@ -382,10 +406,10 @@ class AltoCurtainDevice(AltoDevice):
 
     def __init__(self, controller: Agent, devid: str, nbsubdev: int = 1) -> AltoDevice:
         super().__init__(controller, devid, nbsubdev)
-        self._is_state_updated = {}
+        #: One flag per subdevice, set when its state changed and not yet sent
+        self._is_state_updated = bytearray(self.number_subdevices)
         for idx in range(self.number_subdevices):
             self.current_state[idx]["curtain"] = {"control_state": None}
-            self._is_state_updated[idx] = False
 
     def open_curtain(self, subdev):
         """
@@ -424,9 +448,11 @@ class AltoCurtainDevice(AltoDevice):
         The value is not checked against allowed values.
         """
 
-        if self.current_state[subdevice_idx]["curtain"][prop] != value:
-            self.current_state[subdevice_idx]["curtain"][prop] = value
-            self._is_state_updated[subdevice_idx] = True
+        curtain = self.current_state[subdevice_idx]["curtain"]
+        if curtain[prop] == value:
+            return
+        curtain[prop] = value
+        self._is_state_updated[subdevice_idx] = 1
 
     def update_control_state(self, subdevice_idx, value):
         """
@@ -445,6 +471,36 @@ class AltoCurtainDevice(AltoDevice):
         return self._is_state_updated
 
 
+class _DataMap(dict):
+    """
+    data_map of a sensor device: a dict that calls on_change whenever an entry is changed in place,
+    reads cost the same as a plain dict.
+    """
+
+    def __init__(self, on_change, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._on_change = on_change
+
+    def _changed(method):
+        def wrapper(self, *args, **kwargs):
+            result = method(self, *args, **kwargs)
+            self._on_change()
+            return result
+
+        wrapper.__name__ = method.__name__
+        return wrapper
+
+    __setitem__ = _changed(dict.__setitem__)
+    __delitem__ = _changed(dict.__delitem__)
+    clear = _changed(dict.clear)
+    pop = _changed(dict.pop)
+    popitem = _changed(dict.popitem)
+    setdefault = _changed(dict.setdefault)
+    update = _changed(dict.update)
+    __ior__ = _changed(dict.__ior__)
+    del _changed
+
+
 class AltoSensorDevice(AltoDevice):
     """
     This is the abstract class describing sensors. It is not meant to be subclassed directly
@@ -456,9 +512,13 @@ class AltoSensorDevice(AltoDevice):
     """
 
     def __init__(self, controller: Agent, devid: str, nbsubdev: int = 1) -> AltoDevice:
+        #: (data point, application name) pairs handled by set_sensor_data, per sensor type
+        self._dp_plan = {}
         super().__init__(controller, devid, nbsubdev)
         self.data_map = {}
         self.datapoint_supported = {}
+        #: to_<sensor type>_<data point> transform per (sensor type, data point), None when not defined
+        self._xform = {}
         for idx in range(self.number_subdevices):
             self.current_state[idx]["sensor"] = {}
 
@@ -467,7 +527,20 @@ class AltoSensorDevice(AltoDevice):
         """
         Which sensor types are supported: Environment, Electrical, Device,...
         """
-        return [x for x in self.datapoint_supported.keys()]
+        return list(self.datapoint_supported)
+
+    @property
+    def data_map(self) -> dict:
+        """
+        Device data point name to application data point name. The assigned dict is copied,
+        changes must be made through self.data_map.
+        """
+        return self._data_map
+
+    @data_map.setter
+    def data_map(self, value: dict) -> None:
+        self._data_map = _DataMap(self._dp_plan.clear, value)
+        self._dp_plan.clear()
 
     def initialise_data(self, sensor_type: str, datapoints: List[str]) -> None:
         """
@@ -482,19 +555,41 @@ class AltoSensorDevice(AltoDevice):
         :rtype: None
 
         """
+        # Snapshot of the data points set_sensor_data handles, as supported now
+        self._dp_plan.pop(sensor_type, None)
+        if sensor_type in self.datapoint_supported:
+            self._datapoint_plan(sensor_type)
+        supported = frozenset(self.datapoint_supported.get(sensor_type, ()))
+        valid = tuple(attr for attr in datapoints if attr in supported)
         for idx in range(self.number_subdevices):
             if sensor_type in self.current_state[idx]["sensor"]:
                 thissd = self.current_state[idx]["sensor"][sensor_type]
-                for attr in set(self.datapoint_supported[sensor_type]).intersection(
-                    set(datapoints)
-                ):
+                for attr in valid:
                     thissd[attr] = None
                 if "timestamp" not in thissd:
                     thissd["timestamp"] = None
             else:
                 _log.error(
                     f"This device does not support {sensor_type} sensors.")
-        _log.debug(f"Devices initialised as {self.current_state[0]}.")
+        _log.debug("Devices initialised as %s.", self.current_state[0])
+
+    def _datapoint_plan(self, sensor_type: str) -> tuple:
+        """
+        The (data point, application name) pairs set_sensor_data looks for in the data of
+        sensor_type, timestamp last. Data points not in data_map are left out.
+
+        The pairs are built once per sensor type, and built again after data_map changes or
+        initialise_data is called. Data points added to datapoint_supported later on are only
+        picked up by initialise_data.
+        """
+        plan = self._dp_plan.get(sensor_type)
+        if plan is None:
+            plan = self._dp_plan[sensor_type] = tuple(
+                (datapoint, self.data_map[datapoint])
+                for datapoint in self.datapoint_supported[sensor_type] + ["timestamp"]
+                if datapoint in self.data_map
+            )
+        return plan
 
     def event_sensor_sample(
         self, subdevice_idx: int, sensor_type: str, datapoint: str
@@ -512,11 +607,17 @@ class AltoSensorDevice(AltoDevice):
 
         """
         _log.debug(
-            f"Running sensor sample for {self.device_id} on {subdevice_idx}, {sensor_type} and {datapoint}"
+            "Running sensor sample for %s on %s, %s and %s",
+            self.device_id,
+            subdevice_idx,
+            sensor_type,
+            datapoint,
         )
 
+        # Samples of all subdevices and types are handed to the controller in one go
+        samples = [] if subdevice_idx == "all" and sensor_type == "all" else None
         if subdevice_idx == "all":
-            subdevice_idx = [x for x in range(0, self.number_subdevices)]
+            subdevice_idx = range(self.number_subdevices)
         else:
             if subdevice_idx >= self.number_subdevices:
                 return
@@ -529,7 +630,7 @@ class AltoSensorDevice(AltoDevice):
             if sensor_type:
                 etype = [sensor_type]
             else:
-                etype = [x for x in self.current_state[sdev]["sensor"].keys()]
+                etype = list(self.current_state[sdev]["sensor"])
 
             for st in etype:
                 if datapoint:
@@ -542,12 +643,15 @@ class AltoSensorDevice(AltoDevice):
                             "timestamp"
                         ]
                 else:
-                    dp = {
-                        x: y for x, y in self.current_state[sdev]["sensor"][st].items()
-                    }
+                    dp = self.current_state[sdev]["sensor"][st].copy()
                 if dp:
                     dp["type"] = st
-                    self.controller.emit_event_sample(self, sdev, dp)
+                    if samples is None:
+                        self.controller.emit_event_sample(self, sdev, dp)
+                    else:
+                        samples.append((sdev, dp))
+        if samples:
+            self.controller.emit_event_sample_bulk(self, samples)
 
     def set_sensor_data(
         self,
@@ -588,13 +692,17 @@ class AltoSensorDevice(AltoDevice):
         """
         # _log.debug(f"set_sensor_data {data} {subdevice} {sensor_type}")
         used_data = []
-        mytmstmp = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc).isoformat()
+        # Built on first use, shared by all the samples sent by this call
+        mytmstmp = None
+        auto_send = self.controller.auto_send
+        emit = self.controller.emit_event_sample
+        xform = self._xform
         if subdevice == "all":
-            lo_subdevices = [x for x in range(self.number_subdevices)]
+            lo_subdevices = range(self.number_subdevices)
         else:
             lo_subdevices = [self.subdevice_name_to_idx(subdevice)]
         if sensor_type is None:
-            lo_sensor_type = [x for x in self.sensor_type_supported]
+            lo_sensor_type = self.sensor_type_supported
         elif sensor_type not in self.sensor_type_supported:
             _log.warning(f"Sensor type {sensor_type} not supported here.")
             return []  # What's that
@@ -607,18 +715,22 @@ class AltoSensorDevice(AltoDevice):
                     this_type
                 ]
                 tstmp_handled = False
-                for datapoint in self.datapoint_supported[this_type] + ["timestamp"]:
+                for datapoint, app_dname in self._datapoint_plan(this_type):
                     # _log.debug(f"Handling data for {datapoint}")
-                    if datapoint in self.data_map:
-                        app_dname = self.data_map[datapoint]
-
-                        if app_dname in data:
-                            # _log.debug(f"Mapping {app_dname}  -->  {datapoint}")
-                            if datapoint == "timestamp":
-                                tstmp_handled = True
-                            f = getattr(
-                                self, "to_" + this_type + "_" + datapoint, lambda x: x
-                            )  # idempotent if not defined
+                    if app_dname in data:
+                        # _log.debug(f"Mapping {app_dname}  -->  {datapoint}")
+                        if datapoint == "timestamp":
+                            tstmp_handled = True
+                        key = (this_type, datapoint)
+                        if key in xform:
+                            f = xform[key]
+                        else:
+                            f = xform[key] = getattr(
+                                self, "to_" + this_type + "_" + datapoint, None
+                            )
+                        if f is None:
+                            nval = data[app_dname]  # idempotent if not defined
+                        else:
                             try:
                                 nval = f(data[app_dname])
                             except Exception as e:
@@ -626,24 +738,25 @@ class AltoSensorDevice(AltoDevice):
                                     f"Value for {app_dname} cannot be computed by \"{'to_' + this_type + '_' + datapoint} \"from value \"{data[app_dname]}\""
                                 )
                                 nval = data[app_dname]
-                            if nval is not None:
-                                if current_type_val[datapoint] != nval:
-                                    # _log.debug(
-                                    # f"{datapoint} was {current_type_val[datapoint]} now {nval}"
-                                    # )
-                                    current_type_val[datapoint] = nval
-                                    if datapoint != "timestamp":
-                                        used_data.append(app_dname)
-                                        was_updated = True
+                        if nval is not None:
+                            if current_type_val[datapoint] != nval:
+                                # _log.debug(
+                                # f"{datapoint} was {current_type_val[datapoint]} now {nval}"
+                                # )
+                                current_type_val[datapoint] = nval
+                                if datapoint != "timestamp":
+                                    used_data.append(app_dname)
+                                    was_updated = True
 
                 # _log.debug(f"set_sensor_data {was_updated} {self.controller.auto_send}")
-                if was_updated and self.controller.auto_send:
+                if was_updated and auto_send:
                     if not tstmp_handled:
+                        if mytmstmp is None:
+                            mytmstmp = utc_isoformat()
                         current_type_val["timestamp"] = mytmstmp
                     mydata = current_type_val.copy()
                     mydata["type"] = this_type
-                    self.controller.emit_event_sample(
-                        self, subdevice_idx, mydata)
+                    emit(self, subdevice_idx, mydata)
 
         return used_data
 
@@ -817,6 +930,17 @@ class AltoRemoteCDevice(AltoDevice):
         """
         raise AltoNotImpl
 
+    #: Method handling each (type, format) of code that can be sent
+    _send_handlers = {
+        ("rf", "raw"): "_send_raw",
+        ("ir", "raw"): "_send_raw",
+        ("ir", "cdsf"): "_send_ir_cdsf",
+        ("ir", "hex"): "_send_ir_hex",
+    }
+
+    #: Method handling each type of code that can be learnt
+    _learn_handlers = {"rf": "command_learn_code_rf", "ir": "command_learn_code_ir"}
+
     def _command_send_code(self, message: Mapping[str, Any]) -> None:
         """
         Here we process the command and generate the required list of
@@ -825,56 +949,60 @@ class AltoRemoteCDevice(AltoDevice):
 
         """
         try:
-            if message["type"].lower() == "rf":
-                if message["format"] != "raw":
-                    _log.error(
-                        f"Sending Radio Frequency requires the raw mode, not {message['format']}"
-                    )
-                    return
-                self.command_send_code(message, is_raw=True)
-            elif message["type"].lower() == "ir":  # Infrared it is
-                if message["format"] == "cdsf":
-                    message["code"] = [
-                        abs(x)
-                        for x in irgen.gen_paired_from_raw(
-                            irgen.gen_simplified_from_raw(
-                                irgen.gen_raw_general(*message["code"])
-                            )
-                        )
-                    ]
-                    self.command_send_code(message, is_raw=False)
-                elif message["format"] == "raw":
-                    self.command_send_code(message, is_raw=True)
-                elif message["format"] == "hex":
-                    if "timing" in message:
-                        message["code"] = self._to_timing(
-                            message["code"], message["timing"]
-                        )
-                        return self.command_send_code(message, is_raw=False)
-                    else:
-                        _log.error("Timing must be provided for 'hex' format.")
-                else:
-                    _log.error(
-                        f"Unsupported format {message['format']} for Infrared code."
-                    )
+            ctype = message["type"].lower()
+            handler = self._send_handlers.get((ctype, message.get("format")))
+            if handler is not None:
+                getattr(self, handler)(message)
+            elif ctype == "rf":
+                _log.error(
+                    f"Sending Radio Frequency requires the raw mode, not {message['format']}"
+                )
+            elif ctype == "ir":  # Infrared it is
+                _log.error(
+                    f"Unsupported format {message['format']} for Infrared code."
+                )
             else:
                 _log.error(f"Code type {message['type']} cannot be handled")
-                return
 
         except Exception as e:
             _log.debug(
                 f"Problem when  decoding send command {message}. Error was {e}")
             _log.exception(e)
 
+    def _send_raw(self, message: Mapping[str, Any]) -> None:
+        self.command_send_code(message, is_raw=True)
+
+    def _send_ir_cdsf(self, message: Mapping[str, Any]) -> None:
+        # Only needed by infrared devices, not imported with the library
+        import irgen
+
+        message["code"] = list(
+            map(
+                abs,
+                irgen.gen_paired_from_raw(
+                    irgen.gen_simplified_from_raw(
+                        irgen.gen_raw_general(*message["code"])
+                    )
+                ),
+            )
+        )
+        self.command_send_code(message, is_raw=False)
+
+    def _send_ir_hex(self, message: Mapping[str, Any]) -> None:
+        if "timing" in message:
+            message["code"] = self._to_timing(message["code"], message["timing"])
+            self.command_send_code(message, is_raw=False)
+        else:
+            _log.error("Timing must be provided for 'hex' format.")
+
     def _command_learn_code(self, message: Mapping[str, Any]) -> None:
         """
         Called by the agent when a learn command is received
 
         """
-        if message["type"].lower() == "rf":
-            self.command_learn_code_rf(message)
-        elif message["type"].lower() == "ir":
-            self.command_learn_code_ir(message)
+        handler = self._learn_handlers.get(message["type"].lower())
+        if handler is not None:
+            getattr(self, handler)(message)
         else:
             _log.error(f"Cannot learn code of type {message['type']}.")
 
@@ -883,16 +1011,14 @@ class AltoRemoteCDevice(AltoDevice):
         Transform a list of frames into a LIRC compatible list of pulse timing pairs
 
         """
+        pulses = _byte_timings(timing["mark"], timing["space 0"], timing["space 1"])
+        if len(code) % 2 == 0 and code.isalnum():
+            codebytes = bytes.fromhex(code)
+        else:
+            codebytes = [int(code[i: i + 2], 16) for i in range(0, len(code), 2)]
         timinglist = [timing["start frame"]]
-        for x in [int(code[i: i + 2], 16) for i in range(0, len(code), 2)]:
-            idx = 0x80
-            while idx:
-                timinglist.append(timing["mark"])
-                if x & idx:
-                    timinglist.append(timing["space 1"])
-                else:
-                    timinglist.append(timing["space 0"])
-                idx >>= 1
+        for x in codebytes:
+            timinglist.extend(pulses[x])
         if "drop bits" in timing:
             timinglist = timinglist[
                 : -2 * timing["drop bits"]
@@ -901,6 +1027,22 @@ class AltoRemoteCDevice(AltoDevice):
         return timinglist
 
 
+@lru_cache(maxsize=16)
+def _byte_timings(mark: int, space_0: int, space_1: int) -> tuple:
+    """
+    Pulse timing of every byte value, a mark and a space per bit, most significant bit first.
+
+    """
+    return tuple(
+        tuple(
+            pulse
+            for bit in range(7, -1, -1)
+            for pulse in (mark, space_1 if byte >> bit & 1 else space_0)
+        )
+        for byte in range(256)
+    )
+
+
 class AltoLocationDevice(AltoDevice):
     """
     This is the base class for locations
@@ -981,6 +1123,37 @@ class AltoLoggerDevice(AltoDevice):
         return
 
 
+def _hvac_state_property(key: str) -> property:
+    """
+    The default current_state_<key> property of AltoHVACDevice, the value of key in
+    current_state[0]["hvac"].
+
+    """
+
+    def getter(self):
+        return self.current_state[0]["hvac"][key]
+
+    getter.hvac_key = key
+    return property(getter)
+
+
+@lru_cache(maxsize=None)
+def _mirrored_hvac_keys(cls: type) -> frozenset:
+    """
+    The keys whose current_state_<key> property is, for the class cls, still the default
+    one built by _hvac_state_property.
+
+    """
+    keys = set()
+    for name in dir(cls):
+        if name.startswith("current_state_"):
+            attr = getattr(cls, name, None)
+            key = name[len("current_state_"):]
+            if isinstance(attr, property) and getattr(attr.fget, "hvac_key", None) == key:
+                keys.add(key)
+    return frozenset(keys)
+
+
 class AltoHVACDevice(AltoDevice):
     """
     This is the base class for hvac devices. Here there is only 1 sunbdevice.
@@ -1040,6 +1213,8 @@ class AltoHVACDevice(AltoDevice):
     ) -> AltoDevice:
         self.update_on_set = False
         super().__init__(controller, devid, 1)
+        #: Bound command_set_<prop> method of each property, filled on first use
+        self._set_handlers = {}
         #: By defaul we expect all possible value
         self.capabilities = {
             "mode": ["off", "auto", "cool", "fan", "dry", "heat"],
@@ -1080,58 +1255,27 @@ class AltoHVACDevice(AltoDevice):
     @property
     def current_hvac_state(self):
         # _log.debug(f"hvac_state for {self.capabilities}")
-        val = {}
-        for k in self.capabilities:
-            val[k] = getattr(self, "current_state_" + k)
-        return val
-
-    @property
-    def current_state_mode(self):
-        return self.current_state[0]["hvac"]["mode"]
-
-    @property
-    def current_state_set_temperature(self):
-        return self.current_state[0]["hvac"]["set_temperature"]
-
-    @property
-    def current_state_room_temperature(self):
-        return self.current_state[0]["hvac"]["room_temperature"]
-
-    @property
-    def current_state_fan(self):
-        return self.current_state[0]["hvac"]["fan"]
-
-    @property
-    def current_state_flow(self):
-        return self.current_state[0]["hvac"]["flow"]
-
-    @property
-    def current_state_horizontal_flow(self):
-        return self.current_state[0]["hvac"]["horizontal_flow"]
-
-    @property
-    def current_state_purifier(self):
-        return self.current_state[0]["hvac"]["purifier"]
-
-    @property
-    def current_state_economy(self):
-        return self.current_state[0]["hvac"]["economy"]
-
-    @property
-    def current_state_lock(self):
-        return self.current_state[0]["hvac"]["lock"]
-
-    @property
-    def current_state_read_lock(self):
-        return self.current_state[0]["hvac"]["read_lock"]
-
-    @property
-    def current_state_alarm(self):
-        return self.current_state[0]["hvac"]["alarm"]
+        hvac = self.current_state[0]["hvac"]
+        # Properties that are not overloaded are read straight from the state
+        mirrored = _mirrored_hvac_keys(type(self))
+        return {
+            k: hvac[k] if k in mirrored else getattr(self, "current_state_" + k)
+            for k in self.capabilities
+        }
 
-    @property
-    def current_state_source(self):
-        return self.current_state[0]["hvac"]["source"]
+    # Mirror current_state[0]["hvac"] by default, subclasses may overload any of them
+    current_state_mode = _hvac_state_property("mode")
+    current_state_set_temperature = _hvac_state_property("set_temperature")
+    current_state_room_temperature = _hvac_state_property("room_temperature")
+    current_state_fan = _hvac_state_property("fan")
+    current_state_flow = _hvac_state_property("flow")
+    current_state_horizontal_flow = _hvac_state_property("horizontal_flow")
+    current_state_purifier = _hvac_state_property("purifier")
+    current_state_economy = _hvac_state_property("economy")
+    current_state_lock = _hvac_state_property("lock")
+    current_state_read_lock = _hvac_state_property("read_lock")
+    current_state_alarm = _hvac_state_property("alarm")
+    current_state_source = _hvac_state_property("source")
 
     def command_set_mode(self, mode: str) -> None:
         """
@@ -1243,14 +1387,17 @@ class AltoHVACDevice(AltoDevice):
 
         if (
             "lock" in self.capabilities
-            and prop in self.current_hvac_state["lock"]
-            and value not in self.current_hvac_state["lock"][prop]
+            and prop in self.current_state_lock
+            and value not in self.current_state_lock[prop]
         ):
             _log.warning(f"{prop} is locked and cannot be set to {value}")
             return
 
         try:
-            getattr(self, "command_set_" + prop)(value)
+            handler = self._set_handlers.get(prop)
+            if handler is None:
+                handler = self._set_handlers[prop] = getattr(self, "command_set_" + prop)
+            handler(value)
         except Exception as e:
             _log.error(f"Could not set {prop}")
             _log.exception(e)
@@ -1267,14 +1414,17 @@ class AltoHVACDevice(AltoDevice):
 
         if (
             "lock" in self.capabilities
-            and prop in self.current_hvac_state["lock"]
-            and value not in self.current_hvac_state["lock"][prop]
+            and prop in self.current_state_lock
+            and value not in self.current_state_lock[prop]
         ):
             _log.warning(f"{prop} is locked and cannot be set to {value}")
             return
 
         try:
-            getattr(self, "command_set_" + prop)(value)
+            handler = self._set_handlers.get(prop)
+            if handler is None:
+                handler = self._set_handlers[prop] = getattr(self, "command_set_" + prop)
+            handler(value)
         except Exception as e:
             _log.error(f"Could not set {prop}")
             _log.exception(e)
@@ -1306,11 +1456,11 @@ class AltoHVACDevice(AltoDevice):
 
         if (
             "lock" in self.capabilities
-            and "temperature" in self.current_hvac_state["lock"]
+            and "temperature" in self.current_state_lock
         ):
             if (
-                temp < self.current_hvac_state["lock"]["temperature"][0]
-                and temp > self.current_hvac_state["lock"]["temperature"][1]
+                temp < self.current_state_lock["temperature"][0]
+                and temp > self.current_state_lock["temperature"][1]
             ):
                 _log.warning(
                     f"Temperature is locked and cannot be set to {temp}")
@@ -1343,11 +1493,11 @@ class AltoHVACDevice(AltoDevice):
 
         if (
             "lock" in self.capabilities
-            and "set_temperature" in self.current_hvac_state["lock"]
+            and "set_temperature" in self.current_state_lock
         ):
             if (
-                temp < self.current_hvac_state["lock"]["set_temperature"][0]
-                and temp > self.current_hvac_state["lock"]["set_temperature"][1]
+                temp < self.current_state_lock["set_temperature"][0]
+                and temp > self.current_state_lock["set_temperature"][1]
             ):
                 _log.warning(
                     f"Temperature is locked and cannot be set to {temp}")
@@ -1464,7 +1614,7 @@ class AltoHVACDevice(AltoDevice):
         value = self.to_schema(prop, dvalue)
         if self.current_state[0]["hvac"][prop] != value:
             self.current_state[0]["hvac"][prop] = value
-            if prop not in self.current_hvac_state["read_lock"]:
+            if prop not in self.current_state_read_lock:
                 return True
         return False
 
@@ -1529,11 +1679,8 @@ class AltoHVACDevice(AltoDevice):
         return self._update_generic("alarm", value)
 
     def status_data(self):
-        data = {}
-        for k, v in self.current_hvac_state.items():
-            if k not in self.current_state[0]["hvac"]["read_lock"]:
-                data[k] = v
-        return data
+        read_lock = self.current_state[0]["hvac"]["read_lock"]
+        return {k: v for k, v in self.current_hvac_state.items() if k not in read_lock}
 
     def command_was_sent(self):
         """
@@ -1857,11 +2004,7 @@ class AltoAgent(Agent):
                             "type": "command",
                             "location": "",
                         }
-                        msgpayload["timestamp"] = (
-                            dt.datetime.utcnow()
-                            .replace(tzinfo=dt.timezone.utc)
-                            .isoformat(),
-                        )
+                        msgpayload["timestamp"] = (utc_isoformat(),)
                         for k, v in message.items():
                             msgpayload[k] = v
                         self.publish(msgtopic, msgpayload, "event")
@@ -2006,9 +2149,7 @@ class AltoAgent(Agent):
             headers={
                 "requesterID": self.core.identity,
                 "message_type": mtype,
-                "TimeStamp": dt.datetime.utcnow()
-                .replace(tzinfo=dt.timezone.utc)
-                .isoformat(),
+                "TimeStamp": utc_isoformat(),
             },
         )
 
@@ -2216,6 +2357,9 @@ class AltoMQTTAgent(AltoBridgeAgent):
         _log.debug("Connecting to MQTT ")
         if self.mqtt_topics and self.mqtt_server:
             # Only if woth it
+            # paho is only needed by the MQTT bridges, not imported with the library
+            import paho.mqtt.client as mqtt
+
             self.mqtt_client = mqtt.Client(userdata=self)
             if self.mqtt_user:
                 self.mqtt_client.username_pw_set(
@@ -2905,22 +3049,38 @@ class AltoSensor(AltoAgent):
 
         """
         # _log.debug(f"emit_event_sample {dev} {subdev} {data}")
-        if {x: y for x, y in data.items() if y != None if x != "type"}:
-            topic = (
-                self.topic
-                + "sensor/"
-                + self.agent_name
-                + "/"
-                + dev.device_id
-                + "/event"
-            )
+        self.emit_event_sample_bulk(dev, [(subdev, data)])
+
+    def emit_event_sample_bulk(
+        self, dev: AltoSensorDevice, samples: List[Any]
+    ) -> None:
+        """
+        Send the samples, a list of (subdevice index, data) pairs, of a device. Each sample
+        is published as its own event, exactly as by emit_event_sample, but the topic is
+        only built once.
+
+        """
+        topic = None
+        for subdev, data in samples:
+            payload = {x: y for x, y in data.items() if y is not None}
+            # Only send if we have something to send.
+            if not any(x != "type" for x in payload):
+                continue
+            if topic is None:
+                topic = (
+                    self.topic
+                    + "sensor/"
+                    + self.agent_name
+                    + "/"
+                    + dev.device_id
+                    + "/event"
+                )
             payload = {
                 "device_id": dev.device_id,
                 "subdevice_idx": subdev,
                 "subdevice_name": dev.name_subdevices[subdev],
+                **payload,
             }
-            payload.update({x: y for x, y in data.items() if y != None})
-
             self.publish(topic, payload, "event")
 
     def handle_request_sensor(
@@ -3285,9 +3445,7 @@ class AltoLocation(AltoAgent):
         try:
             flatmsg = {}
             if "timestamp" not in message:  # It should
-                flatmsg["timestamp"] = (
-                    dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc).isoformat()
-                )
+                flatmsg["timestamp"] = utc_isoformat()
             else:
                 flatmsg["timestamp"] = message["timestamp"]
             if "device_id" not in message:
@@ -3943,7 +4101,7 @@ class AltoHealth:
     def _initialize_health_payload(self) -> None:
         """Initialize the health payload with default values"""
         try:
-            _now = pendulum.now(tz=self.timezone).to_iso8601_string()
+            _now = local_isoformat(self.timezone)
             self.health_payload = {
                 "site_id": self.site_id,
                 "timestamp": _now,
@@ -4016,7 +4174,7 @@ class AltoHealth:
             with self._lock:
                 self.health_payload.update(
                     {
-                        "timestamp": pendulum.now(self.timezone).to_iso8601_string(),
+                        "timestamp": local_isoformat(self.timezone),
                         "status": status,
                         "context": context,
                     }
@@ -4037,8 +4195,7 @@ class AltoHealth:
             with self._lock:
                 self.health_payload.update(
                     {
-                        "timestamp": pendulum.now(
-                            self.timezone).to_iso8601_string()
+                        "timestamp": local_isoformat(self.timezone)
                     }
                 )
                 return self.health_payload.copy()
@@ -4135,7 +4292,7 @@ class AltoHealth:
         for payload in highest_priority_payloads:
             if not isinstance(payload, str):
                 try:
-                    payload_str = json.dumps(payload)
+                    payload_str = json_dumps(payload)
                     if not self._publish_with_retry(payload_str, payload):
                         # Store failed publish for retry
                         self.failed_publishes.put(payload)